@@ -0,0 +1,92 @@
+"""
+Benchmark the save and load throughput of the OrigamiCache backends.
+
+Each backend saves and loads a text array and a batch of images in a fresh
+cache, the file system backend is run on the given cache path, the shared
+memory backend on /dev/shm and the SQLite backend with its database in the
+given cache path.
+
+    $ python benchmarks/bench_cache_backends.py --cache-path /tmp \
+        --images 500 --texts 10000
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from origami_lib.backends import (FileSystemCacheBackend,
+                                  SharedMemoryCacheBackend, SQLiteCacheBackend)
+from origami_lib.pipeline import OrigamiCache
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def run(backend, text_array, images, rounds):
+    results = {}
+    for _ in range(rounds):
+        cache = OrigamiCache(backend=backend)
+        image_objects = [io.BytesIO(image) for image in images]
+        for name, elapsed in [
+            ("text save", timed(cache.save_text_array_to_cache, text_array)),
+            ("text load", timed(cache.load_text_array_from_cache)),
+            ("image save", timed(cache.save_image_file_array_to_cache,
+                                 image_objects)),
+            ("image load", timed(cache.load_image_nparr_from_cache)),
+        ]:
+            results[name] = results.get(name, 0) + elapsed
+        cache.delete_current_cache()
+    return dict((name, elapsed / rounds) for name, elapsed in results.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-path", default=tempfile.gettempdir())
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--texts", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    images = [
+        cv2.imencode(".jpg", rng.randint(0, 255, (256, 256, 3),
+                                         dtype=np.uint8))[1].tobytes()
+        for _ in range(args.images)
+    ]
+    text_array = ["entry number {}".format(i) for i in range(args.texts)]
+
+    tempdir = tempfile.mkdtemp(dir=args.cache_path)
+    shm_dir = os.path.join("/dev/shm", os.path.basename(tempdir))
+    backends = [("filesystem", lambda: FileSystemCacheBackend(tempdir)),
+                ("sqlite", lambda: SQLiteCacheBackend(tempdir))]
+    if os.path.isdir("/dev/shm"):
+        backends.insert(1, ("shm", lambda: SharedMemoryCacheBackend(shm_dir)))
+
+    print("{:<12}{:>14}{:>14}{:>14}{:>14}".format(
+        "backend", "text save/s", "text load/s", "image save/s",
+        "image load/s"))
+    try:
+        for name, create_backend in backends:
+            backend = create_backend()
+            results = run(backend, text_array, images, args.rounds)
+            backend.close()
+            print("{:<12}{:>14.0f}{:>14.0f}{:>14.0f}{:>14.0f}".format(
+                name, args.texts / results["text save"],
+                args.texts / results["text load"],
+                args.images / results["image save"],
+                args.images / results["image load"]))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+        shutil.rmtree(shm_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
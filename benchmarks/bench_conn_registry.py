@@ -0,0 +1,76 @@
+"""
+Benchmark the persistent connection registry against the previous list.
+
+The list was scanned for every register, lookup and removal, the registry
+is a dict keyed by socket-id.
+
+    $ python benchmarks/bench_conn_registry.py --sockets 10000 100000
+"""
+import argparse
+import time
+import uuid
+
+from origami_lib.registry import ConnectionRegistry
+
+
+def list_register(conn_map, conn_id):
+    try:
+        next(x for x in conn_map if x["id"] == conn_id)
+    except StopIteration:
+        conn_map.append({"id": conn_id, "func": len, "arguments": [],
+                         "timestamp": time.time()})
+
+
+def list_lookup(conn_map, conn_id):
+    return next(x for x in conn_map if x["id"] == conn_id)
+
+
+def list_remove(conn_map, conn_id):
+    conn_map.remove(list_lookup(conn_map, conn_id))
+
+
+def timed(func, conn_map, conn_ids):
+    start = time.time()
+    for conn_id in conn_ids:
+        func(conn_map, conn_id)
+    return (time.time() - start) / len(conn_ids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sockets", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument(
+        "--ops", type=int, default=1000,
+        help="Operations timed against the full registry")
+    args = parser.parse_args()
+
+    print("{:<10}{:<10}{:>14}{:>14}{:>14}".format(
+        "sockets", "registry", "register us", "lookup us", "remove us"))
+    for sockets in args.sockets:
+        conn_ids = [uuid.uuid4().hex for _ in range(sockets)]
+        sample = conn_ids[-args.ops:]
+
+        conn_list = [{"id": conn_id, "func": len, "arguments": [],
+                      "timestamp": time.time()}
+                     for conn_id in conn_ids[:-args.ops]]
+        registry = ConnectionRegistry()
+        for conn_id in conn_ids[:-args.ops]:
+            registry.register(conn_id, len, [])
+
+        results = [
+            ("list", timed(list_register, conn_list, sample),
+             timed(list_lookup, conn_list, sample),
+             timed(list_remove, conn_list, sample)),
+            ("dict", timed(lambda r, c: r.register(c, len, []), registry,
+                           sample),
+             timed(lambda r, c: r.get(c), registry, sample),
+             timed(lambda r, c: r.remove(c), registry, sample)),
+        ]
+        for name, register, lookup, remove in results:
+            print("{:<10}{:<10}{:>14.2f}{:>14.2f}{:>14.2f}".format(
+                sockets, name, register, lookup, remove))
+
+
+if __name__ == "__main__":
+    main()
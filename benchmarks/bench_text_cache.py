@@ -0,0 +1,73 @@
+"""
+Benchmark the text cache format against the legacy python list format.
+
+The legacy format wrote the text array as a python list literal and read it
+back with ast.literal_eval, the current one is a header line followed by one
+JSON encoded entry per line.
+
+    $ python benchmarks/bench_text_cache.py --entries 100000 1000000
+"""
+import argparse
+import ast
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from origami_lib.pipeline import OrigamiCache
+
+
+def legacy_write(file_path, text_array):
+    with open(file_path, "w") as file:
+        text_array = ['"{}"'.format(x) for x in text_array]
+        file.write('[' + ', '.join(text_array) + ']')
+
+
+def legacy_read(file_path):
+    with open(file_path, "r") as cache_file:
+        return ast.literal_eval(cache_file.read().strip())
+
+
+def measure(func, *args):
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--entries", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache = OrigamiCache(cache_path=tempdir)
+        legacy_path = os.path.join(tempdir, "legacy.cache")
+        for entries in args.entries:
+            text_array = ["entry number {}".format(i) for i in range(entries)]
+            results = [
+                ("legacy write", measure(legacy_write, legacy_path,
+                                         text_array)),
+                ("legacy read", measure(legacy_read, legacy_path)),
+                ("framed write", measure(cache.save_text_array_to_cache,
+                                         text_array)),
+                ("framed read", measure(cache.load_text_array_from_cache)),
+            ]
+            for name, (elapsed, peak) in results:
+                print("{:>8} entries {:13} {:8.1f} ms  peak memory "
+                      "{:8.1f} MB".format(entries, name, elapsed * 1000,
+                                          peak / 1e6))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark peak memory and time of decoding uploaded images.
+
+Compares the old decode path of get_image_as_numpy_arr(save into a new
+BytesIO, getvalue, np.fromstring) with utils.decode_image_object for uploads
+held in memory and uploads spooled to a temporary file.
+
+    $ python benchmarks/bench_upload_decode.py --size 4000
+"""
+import argparse
+import io
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+from origami_lib import utils
+
+
+def old_decode(image_object):
+    in_memory = io.BytesIO()
+    image_object.save(in_memory)
+    data = np.frombuffer(in_memory.getvalue(), dtype=np.uint8).copy()
+    image_object.stream.seek(0)
+    return cv2.imdecode(data, 1)
+
+
+def make_upload(content, spooled):
+    if spooled:
+        stream = tempfile.TemporaryFile()
+        stream.write(content)
+        stream.seek(0)
+    else:
+        stream = io.BytesIO(content)
+    return FileStorage(stream=stream, filename="image.jpg")
+
+
+def measure(decode, upload, rounds):
+    tracemalloc.start()
+    start = time.time()
+    for _ in range(rounds):
+        decode(upload)
+    elapsed = (time.time() - start) / rounds
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=4000,
+                        help="Width and height of the test image")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    image = np.random.randint(
+        0, 255, (args.size, args.size, 3), dtype=np.uint8)
+    content = cv2.imencode(".jpg", image)[1].tobytes()
+    print("Encoded upload size: {:.1f} MB".format(len(content) / 1e6))
+
+    for spooled in (False, True):
+        upload = make_upload(content, spooled)
+        for name, decode in (("old", old_decode),
+                             ("new", utils.decode_image_object)):
+            elapsed, peak = measure(decode, upload, args.rounds)
+            print("{:8} {:4} {:8.1f} ms  peak python/numpy memory "
+                  "{:8.1f} MB".format("spooled" if spooled else "memory",
+                                      name, elapsed * 1000, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,902 @@
+import abc
+import ast
+import hashlib
+import itertools
+import json
+import numpy as np
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from . import constants, exceptions, utils
+
+# Base class with ABCMeta as metaclass, for both python 2 and 3.
+_ABC = abc.ABCMeta("_ABC", (object, ), {})
+
+
+def _validate_hash_algorithm(hash_algorithm):
+    """
+    Raises:
+        InvalidCacheConfigException: hashlib does not provide the algorithm.
+    """
+    try:
+        hashlib.new(hash_algorithm)
+    except (TypeError, ValueError):
+        raise exceptions.InvalidCacheConfigException(
+            "Not a valid hash algorithm for blobs : {}".format(hash_algorithm))
+    return hash_algorithm
+
+
+def _iter_image_object(image_object):
+    """
+    Yields the content of image_object in chunks, from its start.
+    """
+    image_object.seek(0)
+    while True:
+        chunk = image_object.read(constants.BLOB_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+    image_object.seek(0)
+
+
+class OrigamiCacheBackend(_ABC):
+    """ Storage of the caches used by OrigamiCache
+    A backend stores for each cache the entries of its text and image
+    manifests and the image blobs it references, named by the hash of their
+    content. OrigamiCache does the validation, locking and memory tier on top
+    of it, so a backend only has to store and retrieve the data. The calls
+    changing a manifest are serialized per manifest by OrigamiCache.
+
+    A backend has to implement all the abstract methods, it cannot be
+    created otherwise.
+
+    Attrs:
+        cache_path: Path holding the storage of the backend.
+        hash_algorithm: hashlib algorithm used to name image blobs.
+    """
+
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM):
+        self.cache_path = utils.validate_cache_path(cache_path)
+        self.hash_algorithm = _validate_hash_algorithm(hash_algorithm)
+
+    @abc.abstractmethod
+    def create_cache(self, cache_id):
+        """
+        Create the storage of a new cache.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def touch_cache(self, cache_id):
+        """
+        Record an access to the cache.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_cache(self, cache_id):
+        """
+        Delete a cache, the blobs are released once no cache references them.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_cache_dir(self, cache_id):
+        """
+        Returns:
+            cache_dir: Directory holding the files of the cache.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write_entries(self, cache_id, name, entries):
+        """
+        Replace the entries of a manifest atomically.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_entries(self, cache_id, name, entries):
+        """
+        Add entries at the end of a manifest, creating it if needed.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_entries(self, cache_id, name):
+        """
+        Yields the entries of a manifest in order.
+
+        Raises:
+            InvalidCachePathException: The manifest does not exist.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def compact_entries(self, cache_id, name):
+        """
+        Rewrite a manifest in its most compact form, if it exists.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_blob(self, cache_id, image_object):
+        """
+        Store image_object as a blob referenced by the cache.
+
+        Returns:
+            blob_hash: Hash of the content of the blob.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_blob(self, cache_id, blob_hash):
+        """
+        Returns:
+            buf: Content of the blob as uint8 numpy array, None if the cache \
+                has no such blob.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_blob_path(self, cache_id, blob_hash):
+        """
+        Returns:
+            blob_path: Path of a read only file with the content of the \
+                blob, it may be shared with other caches.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_blob_refcount(self, blob_hash):
+        """
+        Returns:
+            refcount (int): Caches referencing the blob.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release the resources held by the backend.
+        """
+        pass
+
+
+class FileSystemCacheBackend(OrigamiCacheBackend):
+    """ Stores each cache as a directory of files under cache_path
+    The manifests are text files with a header line followed by one JSON
+    encoded entry per line, so they can be read as a stream and appended to
+    without rewriting them.
+
+    Image blobs are kept once in a content addressed store under the cache
+    path, shared by all the caches. Each cache hard links the blobs it
+    references, the link count of a blob in the store is its reference count
+    and the blob is removed when the last cache referencing it is deleted.
+    Since the path of a blob in a cache is the same file as the blob in the
+    store, the blobs are read only, copy a blob to change it.
+
+    Attrs:
+        cache_path: Global cache path holding the cache directories.
+        hash_algorithm: hashlib algorithm used to name image blobs.
+        shared_blob_store: If True image blobs are stored once in a content \
+            addressed store under cache_path shared by all the caches, each \
+            cache hard links the blobs it references.
+    """
+
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM,
+                 shared_blob_store=constants.SHARED_BLOB_STORE):
+        OrigamiCacheBackend.__init__(self, cache_path, hash_algorithm)
+        self.shared_blob_store = shared_blob_store
+
+    def get_cache_dir(self, cache_id):
+        return os.path.join(self.cache_path, cache_id)
+
+    def __get_cache_file(self, cache_id, name):
+        return os.path.join(self.cache_path, cache_id, name)
+
+    def __get_blobs_dir(self, cache_id):
+        return os.path.join(self.cache_path, cache_id,
+                            constants.IMAGE_BLOBS_DIR)
+
+    def create_cache(self, cache_id):
+        """
+        Raises:
+            FileHandlingException: Exception during creating directory for \
+                the cache.
+        """
+        cache_dir = self.get_cache_dir(cache_id)
+        try:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            # The marker identifies the directory as an origami cache for
+            # the cache manager, its mtime is the last access of the cache.
+            open(os.path.join(cache_dir, constants.CACHE_MARKER_FILE),
+                 "a").close()
+        except (IOError, OSError):
+            raise exceptions.FileHandlingException(
+                "Error when creating directory for cache :: {}.".format(
+                    cache_dir))
+
+    def touch_cache(self, cache_id):
+        try:
+            os.utime(
+                os.path.join(self.get_cache_dir(cache_id),
+                             constants.CACHE_MARKER_FILE), None)
+        except OSError:
+            pass
+
+    def delete_cache(self, cache_id):
+        blobs_hash = self.__list_cache_blobs(cache_id)
+        shutil.rmtree(self.get_cache_dir(cache_id))
+        if self.shared_blob_store:
+            for blob_hash in blobs_hash:
+                self.__release_store_blob(blob_hash)
+
+    def __encode_entries(self, entries):
+        """
+        Encodes entries as JSON, one per line. JSON strings never contain a
+        raw newline so the whole list is encoded in a single call with a
+        newline as the item separator.
+
+        Returns:
+            content(str): Lines for the entries, each ending with a newline.
+        """
+        entries = list(entries)
+        if not entries:
+            return ""
+        return json.dumps(entries, separators=("\n", ":"))[1:-1] + "\n"
+
+    def __decode_lines(self, lines, file_path):
+        """
+        Decodes a batch of lines of a cache file in a single call.
+
+        Raises:
+            MalformedCacheException: A line is not valid JSON.
+        """
+        try:
+            return json.loads("[" + ",".join(lines) + "]")
+        except ValueError:
+            raise exceptions.MalformedCacheException(
+                "Cache file contains a malformed entry :: {}".format(file_path))
+
+    def __replace_cache_file(self, file_path, entries):
+        """
+        Writes the entries to the cache file, replacing the file atomically.
+        """
+        fd, tmp_file_path = tempfile.mkstemp(
+            prefix=constants.TMP_BLOB_PREFIX, dir=os.path.dirname(file_path))
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(constants.CACHE_FILE_HEADER + "\n")
+                file.write(self.__encode_entries(entries))
+            os.rename(tmp_file_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+            raise
+
+    def __is_legacy_cache_file(self, file_path):
+        """
+        Checks if the cache file is in the legacy python list format, which
+        can not be appended to.
+        """
+        with open(file_path, "r") as cache_file:
+            header = cache_file.readline()
+        return bool(header) and \
+            header.rstrip("\n") != constants.CACHE_FILE_HEADER
+
+    def write_entries(self, cache_id, name, entries):
+        self.__replace_cache_file(self.__get_cache_file(cache_id, name),
+                                  entries)
+
+    def append_entries(self, cache_id, name, entries):
+        """
+        Appends entries to the cache file, only the new entries are written
+        and in a single call, so concurrent appends never interleave within a
+        line. A legacy cache file is converted to the current format, and an
+        incomplete last line left by an interrupted append is dropped.
+        """
+        file_path = self.__get_cache_file(cache_id, name)
+        if os.path.exists(file_path) and \
+                self.__is_legacy_cache_file(file_path):
+            entries = list(self.__iter_cache_file(file_path)) + list(entries)
+            self.__replace_cache_file(file_path, entries)
+            return
+
+        with open(file_path, "ab+") as file:
+            # An interrupted append leaves a line without its newline, the
+            # next entry would be glued to it.
+            file.seek(0, os.SEEK_END)
+            size = self.__get_complete_size(file)
+            if size != file.tell():
+                file.truncate(size)
+            content = self.__encode_entries(entries)
+            if size == 0:
+                content = constants.CACHE_FILE_HEADER + "\n" + content
+            file.write(content.encode("utf-8"))
+
+    def __get_complete_size(self, file):
+        """
+        Size of a cache file up to the newline ending its last complete
+        line, read backwards from the current position at the end of the
+        file.
+
+        Returns:
+            size (int): Bytes of the file holding complete lines.
+        """
+        end = file.tell()
+        while end > 0:
+            start = max(end - constants.BLOB_CHUNK_SIZE, 0)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            end = start
+        return 0
+
+    def iter_entries(self, cache_id, name):
+        return self.__iter_cache_file(self.__get_cache_file(cache_id, name))
+
+    def __iter_cache_file(self, file_path):
+        """
+        Takes a file_path(A cache file) and yields the entries stored in it
+        one by one, ignoring a last line left incomplete by an interrupted
+        append. Cache files written in the legacy python list format are
+        still read, they are parsed whole using ast module.
+
+        Raises:
+            MalformedCacheException: The cache file we are trying to parse is \
+                malformed.
+            InvalidCachePathException: The path provided to read does not exist.
+        """
+        if not os.path.exists(file_path):
+            raise exceptions.InvalidCachePathException(
+                "No valid cache file found :: {}".format(file_path))
+
+        with open(file_path, "r") as cache_file:
+            header = cache_file.readline()
+            if header.rstrip("\n") == constants.CACHE_FILE_HEADER:
+                # Entries are decoded in batches of lines, streaming the file
+                # without paying a json.loads call per entry.
+                while True:
+                    batch = list(itertools.islice(
+                        cache_file, constants.CACHE_FILE_READ_BATCH))
+                    if not batch:
+                        return
+                    # A last line without its newline is left by an append
+                    # interrupted half way, it is not an entry.
+                    lines = [
+                        line.rstrip("\n") for line in batch
+                        if line.endswith("\n")
+                    ]
+                    lines = [line for line in lines if line]
+                    for entry in self.__decode_lines(lines, file_path):
+                        yield entry
+
+            content = header + cache_file.read()
+            try:
+                eval_ds = ast.literal_eval(content.strip())
+            except (SyntaxError, ValueError):
+                raise exceptions.MalformedCacheException(
+                    "Text cache does not contain a valid string to be\
+                    evaluated")
+            for entry in eval_ds:
+                yield entry
+
+    def compact_entries(self, cache_id, name):
+        """
+        Rewrites the cache file in the current format, a legacy cache file is
+        converted and a last line left incomplete by an append interrupted
+        half way is dropped.
+        """
+        file_path = self.__get_cache_file(cache_id, name)
+        if not os.path.exists(file_path):
+            return
+
+        if self.__is_legacy_cache_file(file_path):
+            entries = list(self.__iter_cache_file(file_path))
+        else:
+            with open(file_path, "r") as cache_file:
+                cache_file.readline()
+                lines = cache_file.read().split("\n")
+            # A complete file ends with a newline, so the last item is empty.
+            lines = [line for line in lines[:-1] if line]
+            entries = self.__decode_lines(lines, file_path)
+        self.__replace_cache_file(file_path, entries)
+
+    def _get_store_blob_path(self, blob_hash):
+        """
+        Path of a blob in the shared blob store.
+
+        Args:
+            blob_hash: Hash of the blob.
+
+        Returns:
+            store_blob_path: Path of the blob, it may not exist.
+        """
+        return os.path.join(self.cache_path, constants.SHARED_BLOB_STORE_DIR,
+                            self.hash_algorithm, blob_hash[:2], blob_hash)
+
+    def get_blob_refcount(self, blob_hash):
+        """
+        Number of caches referencing a blob of the shared blob store, each
+        cache referencing the blob holds a hard link to it.
+
+        Returns:
+            refcount (int): Caches referencing the blob, 0 if the blob is \
+                not in the store.
+        """
+        try:
+            return os.stat(self._get_store_blob_path(blob_hash)).st_nlink - 1
+        except OSError:
+            return 0
+
+    def __list_cache_blobs(self, cache_id):
+        """
+        Returns:
+            blobs_hash: Hash of all the blobs in the cache.
+        """
+        image_cache_dir = self.__get_blobs_dir(cache_id)
+        if not os.path.isdir(image_cache_dir):
+            return []
+        # Blobs are named by their hash alone, skip temporary files and
+        # the decoded arrays stored next to the blobs.
+        return [
+            name for name in os.listdir(image_cache_dir)
+            if not name.startswith(constants.TMP_BLOB_PREFIX)
+            if "." not in name
+        ]
+
+    def __release_store_blob(self, blob_hash):
+        """
+        Remove a blob from the shared blob store once no cache references it.
+        """
+        store_blob_path = self._get_store_blob_path(blob_hash)
+        try:
+            if os.stat(store_blob_path).st_nlink == 1:
+                os.remove(store_blob_path)
+        except OSError:
+            pass
+
+    def __write_blob(self, image_object, blob_dir, hasher=None):
+        """
+        Streams image_object in chunks to a temporary file in blob_dir,
+        hashing it in the same pass when a hasher is provided.
+
+        Returns:
+            tmp_blob_path: Path of the temporary file written.
+        """
+        fd, tmp_blob_path = tempfile.mkstemp(
+            prefix=constants.TMP_BLOB_PREFIX, dir=blob_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in _iter_image_object(image_object):
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    file.write(chunk)
+        except Exception:
+            os.remove(tmp_blob_path)
+            raise
+        return tmp_blob_path
+
+    def __commit_blob(self, tmp_blob_path, blob_path):
+        """
+        Atomically rename a temporary blob to blob_path, read only, if the
+        blob already exists the temporary one is discarded.
+        """
+        if os.path.exists(blob_path):
+            os.remove(tmp_blob_path)
+        else:
+            os.chmod(tmp_blob_path, constants.BLOB_FILE_MODE)
+            os.rename(tmp_blob_path, blob_path)
+
+    def save_blob(self, cache_id, image_object):
+        """
+        Saves a single image_object as a blob in the image blobs directory of
+        the cache, named after the hash of its content.
+
+        The image_object is read in chunks which are hashed and written to a
+        temporary file in the same pass, the file is then atomically renamed
+        to the blob name. If a blob with the same hash already exists the
+        temporary file is discarded and the blob is left untouched.
+
+        With the shared blob store the image_object is hashed first, it is
+        only written to the store when no blob with the same hash is there
+        yet, the cache then gets a hard link to the blob in the store. So the
+        disk usage and writes scale with the unique images. The blobs are
+        read only, as the other caches holding the same image share the
+        file.
+
+        Args:
+            cache_id: Cache referencing the blob.
+            image_object: Image object to save as a blob.
+
+        Returns:
+            blob_hash: Hash of the blob saved.
+        """
+        image_cache_dir = self.__get_blobs_dir(cache_id)
+        if not os.path.exists(image_cache_dir):
+            os.makedirs(image_cache_dir)
+
+        if not self.shared_blob_store:
+            hasher = hashlib.new(self.hash_algorithm)
+            tmp_blob_path = self.__write_blob(image_object, image_cache_dir,
+                                              hasher)
+            blob_hash = hasher.hexdigest()
+            self.__commit_blob(tmp_blob_path,
+                               os.path.join(image_cache_dir, blob_hash))
+            return blob_hash
+
+        hasher = hashlib.new(self.hash_algorithm)
+        for chunk in _iter_image_object(image_object):
+            hasher.update(chunk)
+        blob_hash = hasher.hexdigest()
+
+        image_blob_path = os.path.join(image_cache_dir, blob_hash)
+        if os.path.exists(image_blob_path):
+            return blob_hash
+
+        store_blob_path = self._get_store_blob_path(blob_hash)
+        store_blob_dir = os.path.dirname(store_blob_path)
+        if not os.path.exists(store_blob_dir):
+            try:
+                os.makedirs(store_blob_dir)
+            except OSError:
+                # Created by a concurrent writer.
+                if not os.path.isdir(store_blob_dir):
+                    raise
+
+        for _ in range(constants.BLOB_LINK_RETRIES):
+            if not os.path.exists(store_blob_path):
+                tmp_blob_path = self.__write_blob(image_object,
+                                                  store_blob_dir)
+                self.__commit_blob(tmp_blob_path, store_blob_path)
+            try:
+                os.link(store_blob_path, image_blob_path)
+                return blob_hash
+            except OSError as e:
+                if os.path.exists(image_blob_path):
+                    return blob_hash
+                if os.path.exists(store_blob_path):
+                    # Hard links are not supported, copy the blob instead.
+                    shutil.copyfile(store_blob_path, image_blob_path)
+                    os.chmod(image_blob_path, constants.BLOB_FILE_MODE)
+                    return blob_hash
+                last_error = e
+
+        # The blob was released from the store each time before linking.
+        raise last_error
+
+    def read_blob(self, cache_id, blob_hash):
+        try:
+            return np.fromfile(
+                self.get_blob_path(cache_id, blob_hash), dtype=np.uint8)
+        except (IOError, OSError):
+            return None
+
+    def get_blob_path(self, cache_id, blob_hash):
+        return os.path.join(self.__get_blobs_dir(cache_id), blob_hash)
+
+
+class SharedMemoryCacheBackend(FileSystemCacheBackend):
+    """ Stores the caches as files in shared memory
+    Same layout as FileSystemCacheBackend under a tmpfs mount, /dev/shm by
+    default, so nothing goes to the disk. The caches are lost on reboot and
+    use RAM, so keep them bounded with OrigamiCacheManager.
+
+    Attrs:
+        cache_path: Directory in the tmpfs mount holding the caches, it is \
+            created if needed.
+    """
+
+    def __init__(self,
+                 cache_path=constants.SHM_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM,
+                 shared_blob_store=constants.SHARED_BLOB_STORE):
+        if not os.path.isdir(os.path.dirname(os.path.abspath(cache_path))):
+            raise exceptions.InvalidCacheConfigException(
+                "No shared memory mount for the cache : {}".format(cache_path))
+        try:
+            os.makedirs(cache_path)
+        except OSError:
+            # Already created.
+            pass
+        FileSystemCacheBackend.__init__(self, cache_path, hash_algorithm,
+                                        shared_blob_store)
+
+
+class SQLiteCacheBackend(OrigamiCacheBackend):
+    """ Stores all the caches in a single SQLite database
+    Avoids the many small files of the file system backend, which are slow
+    on network disks. Manifests entries are rows ordered by their insertion,
+    blobs are stored once in a table indexed by their hash and referenced by
+    the caches through a link table.
+
+    A blob is only written to a file when its path is asked for, in a
+    directory next to the database which is deleted with the cache.
+
+    Attrs:
+        cache_path: Directory holding the database file.
+        db_path: Path of the database file.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS caches (
+            cache_id TEXT PRIMARY KEY,
+            last_access REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS manifests (
+            cache_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (cache_id, name));
+        CREATE TABLE IF NOT EXISTS entries (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            entry TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS entries_manifest
+            ON entries (cache_id, name, seq);
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS cache_blobs (
+            cache_id TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (cache_id, hash));
+        CREATE INDEX IF NOT EXISTS cache_blobs_hash ON cache_blobs (hash);
+    """
+
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM):
+        OrigamiCacheBackend.__init__(self, cache_path, hash_algorithm)
+        self.db_path = os.path.join(self.cache_path,
+                                    constants.SQLITE_CACHE_FILE)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        with self._get_connection() as conn:
+            conn.executescript(self._SCHEMA)
+
+    def _get_connection(self):
+        """
+        Returns:
+            conn: sqlite3 connection of the calling thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=constants.SQLITE_TIMEOUT)
+            # Readers do not block the writer and the other way around.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """
+        Close the connections of all the threads.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def get_cache_dir(self, cache_id):
+        return os.path.join(self.cache_path, constants.SQLITE_BLOB_DIR,
+                            cache_id)
+
+    def create_cache(self, cache_id):
+        with self._get_connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO caches VALUES (?, ?)",
+                         (cache_id, time.time()))
+
+    def touch_cache(self, cache_id):
+        with self._get_connection() as conn:
+            conn.execute(
+                "UPDATE caches SET last_access = ? WHERE cache_id = ?",
+                (time.time(), cache_id))
+
+    def delete_cache(self, cache_id):
+        with self._get_connection() as conn:
+            blobs_hash = [
+                row[0] for row in conn.execute(
+                    "SELECT hash FROM cache_blobs WHERE cache_id = ?",
+                    (cache_id, ))
+            ]
+            for table in ("entries", "manifests", "cache_blobs", "caches"):
+                conn.execute(
+                    "DELETE FROM {} WHERE cache_id = ?".format(table),
+                    (cache_id, ))
+            conn.executemany(
+                "DELETE FROM blobs WHERE hash = ? AND NOT EXISTS "
+                "(SELECT 1 FROM cache_blobs WHERE cache_blobs.hash = ?)",
+                [(blob_hash, blob_hash) for blob_hash in blobs_hash])
+        shutil.rmtree(self.get_cache_dir(cache_id), ignore_errors=True)
+
+    def __insert_entries(self, conn, cache_id, name, entries):
+        conn.execute("INSERT OR IGNORE INTO manifests VALUES (?, ?)",
+                     (cache_id, name))
+        conn.executemany(
+            "INSERT INTO entries (cache_id, name, entry) VALUES (?, ?, ?)",
+            [(cache_id, name, json.dumps(entry)) for entry in entries])
+
+    def write_entries(self, cache_id, name, entries):
+        with self._get_connection() as conn:
+            conn.execute(
+                "DELETE FROM entries WHERE cache_id = ? AND name = ?",
+                (cache_id, name))
+            self.__insert_entries(conn, cache_id, name, entries)
+
+    def append_entries(self, cache_id, name, entries):
+        with self._get_connection() as conn:
+            self.__insert_entries(conn, cache_id, name, entries)
+
+    def iter_entries(self, cache_id, name):
+        conn = self._get_connection()
+        if conn.execute(
+                "SELECT 1 FROM manifests WHERE cache_id = ? AND name = ?",
+                (cache_id, name)).fetchone() is None:
+            raise exceptions.InvalidCachePathException(
+                "No valid cache manifest found :: {}/{}".format(
+                    cache_id, name))
+
+        rows = conn.execute(
+            "SELECT entry FROM entries WHERE cache_id = ? AND name = ? "
+            "ORDER BY seq", (cache_id, name))
+        while True:
+            batch = rows.fetchmany(constants.CACHE_FILE_READ_BATCH)
+            if not batch:
+                return
+            try:
+                entries = json.loads("[" + ",".join(row[0]
+                                                    for row in batch) + "]")
+            except ValueError:
+                raise exceptions.MalformedCacheException(
+                    "Cache manifest contains a malformed entry :: {}/{}".
+                    format(cache_id, name))
+            for entry in entries:
+                yield entry
+
+    def compact_entries(self, cache_id, name):
+        """
+        Entries are rows, appending never leaves a manifest incomplete so
+        there is nothing to compact.
+        """
+        pass
+
+    def __write_blob(self, conn, rowid, image_object):
+        """
+        Streams image_object into the blob allocated in row rowid, in chunks
+        when sqlite3 supports blob I/O.
+        """
+        if hasattr(conn, "blobopen"):
+            blob = conn.blobopen("blobs", "data", rowid)
+            try:
+                for chunk in _iter_image_object(image_object):
+                    blob.write(chunk)
+            finally:
+                blob.close()
+        else:
+            image_object.seek(0)
+            conn.execute("UPDATE blobs SET data = ? WHERE rowid = ?",
+                         (sqlite3.Binary(image_object.read()), rowid))
+            image_object.seek(0)
+
+    def save_blob(self, cache_id, image_object):
+        """
+        The upload is hashed in a first pass and streamed to the database in
+        a second one, it is never held in memory as a whole.
+        """
+        hasher = hashlib.new(self.hash_algorithm)
+        size = 0
+        for chunk in _iter_image_object(image_object):
+            hasher.update(chunk)
+            size += len(chunk)
+        blob_hash = hasher.hexdigest()
+
+        conn = self._get_connection()
+        with conn:
+            # Takes the write lock before looking for the blob, so a
+            # concurrent delete_cache cannot drop it before it is linked.
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO blobs VALUES (?, zeroblob(?))",
+                (blob_hash, size))
+            if cursor.rowcount == 1:
+                self.__write_blob(conn, cursor.lastrowid, image_object)
+            conn.execute("INSERT OR IGNORE INTO cache_blobs VALUES (?, ?)",
+                         (cache_id, blob_hash))
+        return blob_hash
+
+    def read_blob(self, cache_id, blob_hash):
+        row = self._get_connection().execute(
+            "SELECT blobs.data FROM cache_blobs JOIN blobs "
+            "ON blobs.hash = cache_blobs.hash "
+            "WHERE cache_blobs.cache_id = ? AND cache_blobs.hash = ?",
+            (cache_id, blob_hash)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.uint8)
+
+    def get_blob_path(self, cache_id, blob_hash):
+        """
+        Writes the blob to a file the first time its path is asked for.
+        """
+        blob_dir = self.get_cache_dir(cache_id)
+        blob_path = os.path.join(blob_dir, blob_hash)
+        if os.path.exists(blob_path):
+            return blob_path
+
+        buf = self.read_blob(cache_id, blob_hash)
+        if buf is None:
+            return blob_path
+        if not os.path.exists(blob_dir):
+            try:
+                os.makedirs(blob_dir)
+            except OSError:
+                # Created by a concurrent writer.
+                if not os.path.isdir(blob_dir):
+                    raise
+        fd, tmp_blob_path = tempfile.mkstemp(
+            prefix=constants.TMP_BLOB_PREFIX, dir=blob_dir)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(buf.tobytes())
+            os.chmod(tmp_blob_path, constants.BLOB_FILE_MODE)
+            os.rename(tmp_blob_path, blob_path)
+        except Exception:
+            if os.path.exists(tmp_blob_path):
+                os.remove(tmp_blob_path)
+            raise
+        return blob_path
+
+    def get_blob_refcount(self, blob_hash):
+        return self._get_connection().execute(
+            "SELECT COUNT(*) FROM cache_blobs WHERE hash = ?",
+            (blob_hash, )).fetchone()[0]
+
+
+def create_cache_backend(backend=constants.CACHE_BACKEND_FILESYSTEM,
+                         cache_path=constants.GLOBAL_CACHE_PATH,
+                         hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM):
+    """
+    Creates one of the built in cache backends by name.
+
+    Args:
+        backend: One of
+
+            * filesystem -> FileSystemCacheBackend under cache_path.
+            * shm -> SharedMemoryCacheBackend under /dev/shm, cache_path is \
+                not used.
+            * sqlite -> SQLiteCacheBackend with its database in cache_path.
+        cache_path: Global cache path.
+        hash_algorithm: hashlib algorithm used to name image blobs.
+
+    Returns:
+        backend: The OrigamiCacheBackend.
+
+    Raises:
+        InvalidCacheConfigException: Not a known backend.
+    """
+    if backend == constants.CACHE_BACKEND_FILESYSTEM:
+        return FileSystemCacheBackend(cache_path, hash_algorithm)
+    elif backend == constants.CACHE_BACKEND_SHM:
+        return SharedMemoryCacheBackend(hash_algorithm=hash_algorithm)
+    elif backend == constants.CACHE_BACKEND_SQLITE:
+        return SQLiteCacheBackend(cache_path, hash_algorithm)
+    raise exceptions.InvalidCacheConfigException(
+        "Not a valid cache backend : {}".format(backend))
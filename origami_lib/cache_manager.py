@@ -0,0 +1,291 @@
+import argparse
+import os
+import re
+import shutil
+import threading
+import time
+
+from . import constants, exceptions, utils
+
+# Cache directories are named after the hex of a uuid4, see OrigamiCache.
+CACHE_ID_REGEXP = re.compile(r'^[0-9a-f]{32}$')
+
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+class OrigamiCacheManager(object):
+    """ Garbage collector for the caches under the global cache path
+    Nothing else deletes the cache directories created by OrigamiCache
+    unless the handler asks for it, the cache manager enforces a maximum
+    total size and a time to live for them.
+
+    A sweep first deletes the caches not accessed for longer than the ttl,
+    then deletes the least recently accessed caches until the total size is
+    within max_size, and finally deletes the blobs of the shared blob store
+    which are not referenced by any cache anymore. Only directories marked
+    as origami caches are ever touched.
+
+    .. code-block:: python
+
+        manager = OrigamiCacheManager("/tmp", max_size=10 * 1024**3,
+                                      ttl=3600)
+        report = manager.sweep()
+        print(report["reclaimed_bytes"])
+
+        # Or keep sweeping in the background
+        manager.start_sweeper(interval=60)
+
+    It can also be run once from the command line
+
+    .. code-block:: bash
+
+        $ origami-cache-gc --cache-path /tmp --max-size 10G --ttl 3600
+
+    Attrs:
+        cache_path: Global cache path holding the caches.
+        max_size: Maximum total size of the caches in bytes, None for no \
+            limit.
+        ttl: Seconds after its last access a cache is deleted, None for no \
+            limit.
+    """
+
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 max_size=None,
+                 ttl=None):
+        self.cache_path = utils.validate_cache_path(cache_path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"sweeps": 0, "removed_caches": 0, "reclaimed_bytes": 0}
+
+    @staticmethod
+    def _get_file_size(path):
+        """
+        Share of the disk space of a file owned by one cache, a blob hard
+        linked from the shared blob store is split between the caches linking
+        to it.
+        """
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return 0
+        return st.st_size // max(st.st_nlink - 1, 1)
+
+    def _list_caches(self):
+        """
+        Lists the caches under cache_path.
+
+        Returns:
+            caches (list): (last_access, size, cache_dir) for each cache.
+        """
+        caches = []
+        for name in os.listdir(self.cache_path):
+            cache_dir = os.path.join(self.cache_path, name)
+            marker = os.path.join(cache_dir, constants.CACHE_MARKER_FILE)
+            if not CACHE_ID_REGEXP.match(name) or not os.path.isfile(marker):
+                continue
+            try:
+                last_access = os.stat(marker).st_mtime
+            except OSError:
+                continue
+
+            size = 0
+            for root, _, files in os.walk(cache_dir):
+                for file_name in files:
+                    size += self._get_file_size(os.path.join(root, file_name))
+            caches.append((last_access, size, cache_dir))
+        return caches
+
+    def _remove_cache(self, cache_dir):
+        """
+        Deletes a cache directory.
+
+        Returns:
+            reclaimed (int): Bytes freed, blobs still linked from the blob \
+                store are freed later by _remove_unreferenced_blobs.
+        """
+        reclaimed = 0
+        for root, _, files in os.walk(cache_dir):
+            for file_name in files:
+                try:
+                    st = os.lstat(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                if st.st_nlink == 1:
+                    reclaimed += st.st_size
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return reclaimed
+
+    def _remove_unreferenced_blobs(self):
+        """
+        Deletes the blobs of the shared blob store which no cache links to.
+
+        Returns:
+            reclaimed (int): Bytes freed.
+        """
+        reclaimed = 0
+        store_dir = os.path.join(self.cache_path,
+                                 constants.SHARED_BLOB_STORE_DIR)
+        for root, _, files in os.walk(store_dir):
+            for file_name in files:
+                blob_path = os.path.join(root, file_name)
+                try:
+                    st = os.lstat(blob_path)
+                    if st.st_nlink == 1:
+                        os.remove(blob_path)
+                        reclaimed += st.st_size
+                except OSError:
+                    pass
+        return reclaimed
+
+    def sweep(self):
+        """
+        Deletes the expired caches, then the least recently used ones until
+        the total size is within max_size, and then the unreferenced blobs.
+
+        Returns:
+            report (dict): A dict with the following keys
+
+                * `removed_caches`: Caches deleted in this sweep.
+                * `reclaimed_bytes`: Bytes freed by this sweep.
+                * `total_bytes`: Size of the remaining caches.
+        """
+        now = time.time()
+        caches = sorted(self._list_caches())
+        removed_caches = 0
+        reclaimed = 0
+        total_size = sum(size for _, size, _ in caches)
+
+        for last_access, size, cache_dir in caches:
+            expired = self.ttl is not None and now - last_access > self.ttl
+            oversized = self.max_size is not None and \
+                total_size > self.max_size
+            if not expired and not oversized:
+                continue
+
+            reclaimed += self._remove_cache(cache_dir)
+            removed_caches += 1
+            total_size -= size
+
+        reclaimed += self._remove_unreferenced_blobs()
+
+        with self._lock:
+            self._stats["sweeps"] += 1
+            self._stats["removed_caches"] += removed_caches
+            self._stats["reclaimed_bytes"] += reclaimed
+
+        return {
+            "removed_caches": removed_caches,
+            "reclaimed_bytes": reclaimed,
+            "total_bytes": max(total_size, 0)
+        }
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): Sweeps run, caches removed and bytes reclaimed by \
+                this manager so far.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _run_sweeper(self, interval):
+        while not self._stop_sweeper.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print("Origami cache sweep failed : {}".format(e))
+
+    def start_sweeper(self, interval=constants.CACHE_SWEEP_INTERVAL):
+        """
+        Start a daemon thread running sweep every interval seconds.
+
+        Args:
+            interval (float): Seconds between two sweeps.
+        """
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._stop_sweeper.clear()
+            self._sweeper = threading.Thread(
+                target=self._run_sweeper,
+                args=(interval, ),
+                name="origami-cache-sweeper")
+            self._sweeper.daemon = True
+            self._sweeper.start()
+
+    def stop_sweeper(self):
+        """
+        Stop the sweeper thread started by start_sweeper.
+        """
+        with self._lock:
+            sweeper = self._sweeper
+            self._sweeper = None
+        if sweeper is not None:
+            self._stop_sweeper.set()
+            sweeper.join()
+
+
+def parse_size(size):
+    """
+    Parses a size with an optional K, M, G or T suffix to bytes.
+
+    Args:
+        size (str): Size to parse, for example 512M.
+
+    Returns:
+        size (int): Size in bytes.
+
+    Raises:
+        InvalidCacheConfigException: Not a valid size.
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$', str(size),
+                     re.IGNORECASE)
+    if not match:
+        raise exceptions.InvalidCacheConfigException(
+            "Not a valid cache size : {}".format(size))
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()])
+
+
+def _parse_size_arg(size):
+    try:
+        return parse_size(size)
+    except exceptions.InvalidCacheConfigException as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    """
+    Command line entrypoint running a single sweep of the cache manager.
+    """
+    parser = argparse.ArgumentParser(
+        description="Delete expired and least recently used origami caches.")
+    parser.add_argument(
+        "--cache-path",
+        default=constants.GLOBAL_CACHE_PATH,
+        help="Global cache path holding the caches")
+    parser.add_argument(
+        "--max-size",
+        type=_parse_size_arg,
+        default=None,
+        help="Maximum total size of the caches, for example 10G")
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=None,
+        help="Seconds after its last access a cache is deleted")
+
+    args = parser.parse_args(argv)
+
+    manager = OrigamiCacheManager(args.cache_path, args.max_size, args.ttl)
+    report = manager.sweep()
+    print("Removed {removed_caches} caches, reclaimed {reclaimed_bytes} bytes, "
+          "{total_bytes} bytes left".format(**report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -17,9 +17,39 @@ ORIGAMI_DEFAULT_EVENT_ROUTE = "/event"
 
 INPUT_IMAGE_ARRAY_FILEPATH_MODE = "file_path"
 INPUT_IMAGE_ARRAY_NPARRAY_MODE = "numpy_array"
+INPUT_IMAGE_ARRAY_LAZY_MODE = "lazy"
 
 REQUESTS_JSON_HEADERS = {'Content-Type': 'application/json'}
 
+# Number of keep-alive connections kept open to the origami server per app.
+REQUESTER_POOL_SIZE = 10
+
+# Background queue for requests to the origami server, see InjectQueue.
+INJECT_QUEUE_SIZE = 64
+INJECT_QUEUE_WORKERS = 2
+INJECT_QUEUE_POLICY_BLOCK = "block"
+INJECT_QUEUE_POLICY_DROP_OLDEST = "drop_oldest"
+INJECT_QUEUE_POLICY_RAISE = "raise"
+INJECT_QUEUE_POLICIES = [
+    INJECT_QUEUE_POLICY_BLOCK, INJECT_QUEUE_POLICY_DROP_OLDEST,
+    INJECT_QUEUE_POLICY_RAISE
+]
+
+# Executor running the functions registered for persistent connections, see
+# FunctionExecutor.
+FUNCTION_EXECUTOR_THREAD = "thread"
+FUNCTION_EXECUTOR_PROCESS = "process"
+FUNCTION_EXECUTOR_KINDS = [FUNCTION_EXECUTOR_THREAD, FUNCTION_EXECUTOR_PROCESS]
+FUNCTION_EXECUTOR_WORKERS = 4
+
+# Calls of /fass running at once and waiting for their turn, the requests
+# beyond that are answered 503 with a Retry-After in seconds.
+FASS_MAX_IN_FLIGHT = 4
+FASS_MAX_WAITING = 64
+FASS_RETRY_AFTER = 1
+# Default maximum of registered /fass connections, see FunctionServiceHandler.
+FASS_CAPACITY = 1024
+
 DEFAULT_ORIGAMI_RESPONSE_TEMPLATE = [{
     "Copyright": """
 @CloudCV Origami Demo
@@ -28,20 +58,92 @@ DEFAULT_ORIGAMI_RESPONSE_TEMPLATE = [{
 
 DEFAULT_DATA_TYPE_KEY = "data"
 TERMINAL_DATA_TYPE_KEY = "terminalData"
+MULTIPART_DATA_TYPE_KEY = "multipart"
 
 REQUEST_SOCKET_ID_KEY = "socket-id"
 
 IMAGE_JPEG_BASE64_SIG = "data:image/jpeg;base64,"
 IMAGE_PNG_BASE64_SIG = "data:image/png;base64,"
+IMAGE_WEBP_BASE64_SIG = "data:image/webp;base64,"
 
 MIME_TYPE_JPEG = "image/jpeg"
 MIME_TYPE_JPG = "image/jpg"
 MIME_TYPE_PNG = "image/png"
+MIME_TYPE_WEBP = "image/webp"
+
+# Magic numbers used to detect image types without libmagic.
+JPEG_MAGIC_NUMBER = b"\xff\xd8\xff"
+PNG_MAGIC_NUMBER = b"\x89PNG\r\n\x1a\n"
+RIFF_MAGIC_NUMBER = b"RIFF"
+WEBP_MAGIC_NUMBER = b"WEBP"
+# Bytes of a file passed to libmagic when sniffing its mime type.
+MIME_SNIFF_SIZE = 2048
+
+# Formats for encoding numpy images, quality is 0-100 for jpeg and webp and
+# the compression level 0-9 for png. None uses the OpenCV default.
+IMAGE_FORMAT_JPEG = "jpeg"
+IMAGE_FORMAT_PNG = "png"
+IMAGE_FORMAT_WEBP = "webp"
+DEFAULT_IMAGE_ENCODING_FORMAT = IMAGE_FORMAT_JPEG
+DEFAULT_IMAGE_ENCODING_QUALITY = None
+
+# Threads encoding output and decoding input images in parallel, see
+# ImageCodecPool.
+IMAGE_ENCODER_POOL_SIZE = 4
+IMAGE_DECODER_POOL_SIZE = 4
 
 TMP_DIR_BASE_PATH = "/tmp"
 
 GLOBAL_CACHE_PATH = "/tmp"
 
+# First line of the cache files, followed by one JSON encoded entry per line.
+CACHE_FILE_HEADER = "#origami-cache v2"
+# Lines of a cache file decoded together when streaming it.
+CACHE_FILE_READ_BATCH = 4096
 TEXT_CACHE_FILE = "text.cache"
 IMAGE_CACHE_FILE = "image.cache"
 IMAGE_BLOBS_DIR = "img_blobs"
+
+# Blobs are hashed and written in chunks of this size.
+BLOB_CHUNK_SIZE = 64 * 1024
+DEFAULT_BLOB_HASH_ALGORITHM = "md5"
+TMP_BLOB_PREFIX = ".tmp-"
+NPARR_CACHE_EXTENSION = ".npy"
+# Blobs may be shared between caches, so they are written read only.
+BLOB_FILE_MODE = 0o444
+# Images decoded ahead by OrigamiCache.iter_image_nparr_from_cache.
+CACHE_PREFETCH_SIZE = 4
+
+# Content addressed blob store under the global cache path shared by all the
+# caches, see OrigamiCache.
+SHARED_BLOB_STORE = True
+SHARED_BLOB_STORE_DIR = "blob_store"
+BLOB_LINK_RETRIES = 3
+
+# Storage backends of OrigamiCache, see origami_lib.backends.
+CACHE_BACKEND_FILESYSTEM = "filesystem"
+CACHE_BACKEND_SHM = "shm"
+CACHE_BACKEND_SQLITE = "sqlite"
+SHM_CACHE_PATH = "/dev/shm/origami"
+SQLITE_CACHE_FILE = "origami_cache.sqlite"
+# Blobs of the SQLite backend are written here when a file path is needed.
+SQLITE_BLOB_DIR = "origami_sqlite_blobs"
+# Seconds a SQLite connection waits for a lock held by another writer.
+SQLITE_TIMEOUT = 30
+
+# Marks a directory as an origami cache, see OrigamiCacheManager.
+CACHE_MARKER_FILE = ".origami_cache"
+# Seconds between two sweeps of the cache manager sweeper thread.
+CACHE_SWEEP_INTERVAL = 60
+
+# Default byte budget of the in memory tier of the caches, see
+# OrigamiMemoryCache.
+MEMORY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Seconds between two sweeps of the expired persistent websocket connections.
+PERSISTENT_CONN_SWEEP_INTERVAL = 60
+
+# Numpy arguments of registered connections smaller than this are never
+# spilled to disk, see ArgumentStore.
+ARGS_SPILL_MIN_BYTES = 64 * 1024
+ARGS_SPILL_DIR_PREFIX = "origami-args-"
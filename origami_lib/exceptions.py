@@ -40,6 +40,13 @@ class BlobCreationException(OrigamiException):
     STATUS_CODE = 202
 
 
+class InvalidCacheConfigException(OrigamiException):
+    """
+    The configuration provided for the cache is not valid.
+    """
+    STATUS_CODE = 203
+
+
 class InputHandlerException(OrigamiException):
     """
     Exception while handling user request input.
@@ -90,6 +97,20 @@ class InternalServerErrorException(OrigamiException):
     STATUS_CODE = 403
 
 
+class RequesterNoTargetUrlException(OrigamiException):
+    """
+    No target url could be resolved for OrigamiRequester to send data to.
+    """
+    STATUS_CODE = 404
+
+
+class InjectQueueFullException(OrigamiException):
+    """
+    The background inject queue is full, or the payload was dropped from it.
+    """
+    STATUS_CODE = 405
+
+
 class InvalidTokenException(OrigamiException):
     """
     These exceptions are caused by providing invalid token to origami
@@ -0,0 +1,140 @@
+import threading
+
+from . import constants, utils
+from .pipeline import OrigamiCache
+
+
+class LazyImageCache(object):
+    """
+    OrigamiCache shared by the OrigamiImage handles of one request, the cache
+    directory is only created when a handle first needs a file path.
+
+    Attrs:
+        cache_path: Global cache path the cache is created in.
+        hash_algorithm: Hash algorithm for the blobs of the cache.
+        memory_cache: OrigamiMemoryCache of the app, None for no memory tier.
+        backend: OrigamiCacheBackend of the app, None for the default one.
+    """
+
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM,
+                 memory_cache=None,
+                 backend=None):
+        self.cache_path = cache_path
+        self.hash_algorithm = hash_algorithm
+        self.memory_cache = memory_cache
+        self.backend = backend
+        self._cache = None
+        self._lock = threading.Lock()
+
+    def get_cache(self):
+        """
+        Returns:
+            cache: The OrigamiCache, created on first use.
+        """
+        with self._lock:
+            if self._cache is None:
+                self._cache = OrigamiCache(
+                    cache_path=self.cache_path,
+                    hash_algorithm=self.hash_algorithm,
+                    memory_cache=self.memory_cache,
+                    backend=self.backend)
+        return self._cache
+
+
+class OrigamiImage(object):
+    """ Lazy handle to an image uploaded by the user
+    Returned by get_image_array in lazy mode. Nothing is decoded or written
+    to the disk when the handle is created, each piece of work is done when
+    it is first asked for and only for the images which are actually used.
+
+    .. code-block:: python
+
+        images = app.get_image_array(mode="lazy")
+        width, height = images[0].get_dimensions()
+        if width > 1000:
+            image = images[0].get_nparr(max_dimension=512)
+        path = images[0].get_file_path()
+
+    Attrs:
+        image_object: Werkzeug FileStorage uploaded by the user.
+    """
+
+    def __init__(self, image_object, lazy_cache=None):
+        self.image_object = image_object
+        self._lazy_cache = lazy_cache or LazyImageCache()
+        self._buffer = None
+        self._dimensions = None
+        self._file_path = None
+        self._lock = threading.Lock()
+
+    def get_buffer(self):
+        """
+        Returns:
+            buf: Content of the image as a flat uint8 numpy array, see \
+                utils.get_image_buffer.
+        """
+        with self._lock:
+            if self._buffer is None:
+                self._buffer = utils.get_image_buffer(self.image_object)
+        return self._buffer
+
+    def get_bytes(self):
+        """
+        Returns:
+            content: Content of the image as bytes.
+        """
+        return self.get_buffer().tobytes()
+
+    def get_dimensions(self):
+        """
+        Dimensions of the image read from the JPEG/PNG header, the image is
+        only decoded when the header cannot be parsed.
+
+        Returns:
+            dimensions: (width, height) of the image, None if it cannot be \
+                decoded.
+        """
+        if self._dimensions is None:
+            dimensions = utils.get_image_dimensions_from_buffer(
+                self.get_buffer())
+            if dimensions is None:
+                image = self.get_nparr()
+                if image is not None:
+                    dimensions = (image.shape[1], image.shape[0])
+            self._dimensions = dimensions
+        return self._dimensions
+
+    def get_nparr(self, max_dimension=None, grayscale=False, keep_alpha=False):
+        """
+        Decodes the image, the result is not kept by the handle.
+
+        Args:
+            max_dimension, grayscale, keep_alpha: Decode options, see \
+                utils.get_imread_flags.
+
+        Returns:
+            image: Decoded numpy image array, None if it cannot be decoded.
+        """
+        return utils.decode_image_buffer(self.get_buffer(), max_dimension,
+                                         grayscale, keep_alpha)
+
+    def get_file_path(self):
+        """
+        Path of the image in the cache, the image is written to the cache the
+        first time this is called. The file is read only as the other caches
+        holding the same image may share it, copy it to change it.
+
+        Returns:
+            image_file_path: Path of the cached image.
+
+        Raises:
+            BlobCreationException: Error while writing the image to cache.
+        """
+        with self._lock:
+            if self._file_path is None:
+                cache = self._lazy_cache.get_cache()
+                self._file_path = cache.save_image_blob_to_cache(
+                    self.image_object)
+        return self._file_path
@@ -1,23 +1,230 @@
-from collections import deque
-from flask import Flask, request as user_req, jsonify
+from collections import OrderedDict
+from concurrent import futures
+from flask import Flask, g, has_request_context, request as user_req, jsonify
 from flask_cors import CORS, cross_origin
+import atexit
+import functools
 import requests
+import requests.adapters
 import re
 import json
-import time
+import threading
+from tornado import gen
+from tornado.concurrent import Future, chain_future
+from tornado.httpclient import AsyncHTTPClient
 from tornado.wsgi import WSGIContainer
 from tornado.web import Application, FallbackHandler, RequestHandler
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.websocket import WebSocketHandler
 import uuid
 
 from . import constants, exceptions, utils
-from .pipeline import OrigamiCache
+from .backends import (FileSystemCacheBackend, OrigamiCacheBackend,
+                       create_cache_backend)
+from .cache_manager import OrigamiCacheManager
+from .image import LazyImageCache, OrigamiImage
+from .pipeline import OrigamiCache, OrigamiMemoryCache
+from .registry import ArgumentStore, ConnectionRegistry
+from .workers import (FunctionExecutor, ImageCodecPool, InjectQueue,
+                      RequestLimiter)
+
+# Guards lazy creation of requester sessions and their stats.
+_requester_lock = threading.Lock()
+
+# Guards lazy creation of the image codec pools of an app.
+_pool_lock = threading.Lock()
+
+# Key in flask.g holding the outputs buffered for the current request.
+_OUTPUT_BUFFER_KEY = "_origami_output_buffer"
+
+# Runs the functions registered for persistent connections, shared by the
+# websocket and /fass handlers of the process.
+_function_executor = FunctionExecutor()
 
 
 class OrigamiRequester(object):
-    def __init__(self):
-        pass
+    """ Origami requester
+    Sends data to the origami server over a pooled keep-alive HTTP session.
+
+    The session is created lazily on the first request and shared by all
+    the threads of the app, since the underlying connection pool is thread
+    safe. The injection target url is resolved once and reused for every
+    later request.
+
+    Outputs can also be sent through a bounded background InjectQueue by
+    setting inject_queue_size, the send functions then return a future for
+    the response text instead of waiting for the origami server.
+
+    Attributes:
+        requester_pool_size: Maximum number of keep-alive connections kept \
+            open to the origami server.
+        inject_queue_size: Maximum payloads waiting in the inject queue, \
+            0 disables the queue.
+        inject_queue_workers: Threads draining the inject queue.
+        inject_queue_policy: What to do when the inject queue is full, one \
+            of block, drop_oldest or raise.
+    """
+    requester_pool_size = constants.REQUESTER_POOL_SIZE
+    _requester_session = None
+    _requester_target_url = None
+    _requester_io_loop = None
+    inject_queue_size = 0
+    inject_queue_workers = constants.INJECT_QUEUE_WORKERS
+    inject_queue_policy = constants.INJECT_QUEUE_POLICY_BLOCK
+    _inject_queue = None
+
+    def __init__(self,
+                 pool_size=constants.REQUESTER_POOL_SIZE,
+                 inject_queue_size=0,
+                 inject_queue_workers=constants.INJECT_QUEUE_WORKERS,
+                 inject_queue_policy=constants.INJECT_QUEUE_POLICY_BLOCK):
+        self.requester_pool_size = pool_size
+        self.inject_queue_size = inject_queue_size
+        self.inject_queue_workers = inject_queue_workers
+        self.inject_queue_policy = inject_queue_policy
+        self._requester_stats = {"requests": 0, "errors": 0}
+
+    def _get_inject_queue(self):
+        """
+        Returns the background InjectQueue of the requester, creating it on
+        first use. None if inject_queue_size is 0.
+        """
+        if not self.inject_queue_size:
+            return None
+
+        with _requester_lock:
+            if self._inject_queue is None:
+                self._inject_queue = InjectQueue(
+                    self.request_origami_server,
+                    maxsize=self.inject_queue_size,
+                    workers=self.inject_queue_workers,
+                    policy=self.inject_queue_policy)
+        return self._inject_queue
+
+    def _inject_payload(self, payload):
+        """
+        Sends the payload to the origami server, through the background inject
+        queue if one is configured.
+
+        Returns:
+            resp: Response text from the origami server, or a \
+                concurrent.futures.Future resolving to it when the inject \
+                queue is used.
+        """
+        inject_queue = self._get_inject_queue()
+        if inject_queue is not None:
+            return inject_queue.submit(payload)
+        return self.request_origami_server(payload)
+
+    def get_inject_queue_stats(self):
+        """
+        Statistics for the background inject queue, see InjectQueue.get_stats.
+
+        Returns:
+            stats (dict): Queue depth, drain latency and payload counts, None \
+                if the inject queue is not enabled.
+        """
+        inject_queue = self._get_inject_queue()
+        if inject_queue is None:
+            return None
+        return inject_queue.get_stats()
+
+    def _get_requester_session(self):
+        """
+        Returns the requests session used to talk to the origami server,
+        creating it on first use.
+
+        Returns:
+            session: requests.Session with a connection pool of \
+                requester_pool_size connections.
+        """
+        session = self._requester_session
+        if session is not None:
+            return session
+
+        with _requester_lock:
+            session = self._requester_session
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.requester_pool_size,
+                    pool_block=False)
+                session.mount(constants.HTTP_ENDPOINT, adapter)
+                session.mount(constants.HTTPS_ENDPOINT, adapter)
+                self._requester_session = session
+        return session
+
+    def close_requester_session(self):
+        """
+        Close the pooled session and all the connections kept open by it, a
+        new session is created on the next request.
+        """
+        with _requester_lock:
+            session = self._requester_session
+            self._requester_session = None
+        if session is not None:
+            session.close()
+
+    def _get_cached_target_url(self):
+        """
+        Returns the origami server target url, computing it only once using
+        _get_origami_server_target_url.
+
+        Raises:
+            RequesterNoTargetUrlException: No target url could be resolved.
+        """
+        target_url = self._requester_target_url
+        if target_url is None:
+            try:
+                target_url = self._get_origami_server_target_url()
+            except Exception as e:
+                raise exceptions.RequesterNoTargetUrlException(
+                    "No target url retriver function \
+                    _get_origami_server_target_url found : {}".format(e))
+            self._requester_target_url = target_url
+        return target_url
+
+    def _update_requester_stats(self, key):
+        with _requester_lock:
+            self._requester_stats[key] += 1
+
+    def get_requester_stats(self):
+        """
+        Statistics for the connection pool used to request the origami server.
+
+        Returns:
+            stats (dict): A dict with the following keys
+
+                * `requests`: Requests made to the origami server.
+                * `errors`: Requests which failed to connect.
+                * `pool_size`: Maximum keep-alive connections per host.
+                * `connections_opened`: New connections opened so far, \
+                    anything less than `requests` is a reused connection.
+                * `idle_connections`: Connections currently idle in the pool.
+
+            The requests made asynchronously are counted too, they do not \
+            use the pool.
+        """
+        session = self._requester_session
+        with _requester_lock:
+            stats = dict(self._requester_stats)
+
+        stats["pool_size"] = self.requester_pool_size
+        stats["connections_opened"] = 0
+        stats["idle_connections"] = 0
+        if session is None:
+            return stats
+        adapters = set(session.adapters.values())
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats["connections_opened"] += pool.num_connections
+                stats["idle_connections"] += pool.pool.qsize()
+        return stats
 
     def request_origami_server(self, payload):
         """
@@ -27,6 +234,9 @@ class OrigamiRequester(object):
         turn inject the data to user browser provided in the data field of the
         payload.
 
+        The request is made over the pooled session of the requester so
+        consecutive requests reuse an open connection.
+
         Args:
             payload: Python dict which is to be sent to the origami server \
                 The format of the payload is:
@@ -56,51 +266,209 @@ class OrigamiRequester(object):
             OrigamiRequesterException:
                 Some other error code when requesting
         """
-        try:
-            target_url = self._get_origami_server_target_url()
-        except Exception as e:
-            raise exceptions.RequesterNoTargetUrlException(
-                "No target url retriver function _get_origami_server_target_url\
-                found : {}".format(e))
+        target_url = self._get_cached_target_url()
+        session = self._get_requester_session()
 
         # Request the origami server
+        self._update_requester_stats("requests")
         try:
             payload = json.dumps(payload)
-            resp = requests.post(
+            resp = session.post(
                 target_url,
                 headers=constants.REQUESTS_JSON_HEADERS,
                 data=payload)
         except Exception as e:
+            self._update_requester_stats("errors")
             raise exceptions.OrigamiRequesterException(
                 "Connection error when requesting origami server : {}".format(
                     e))
 
-        # Check the response object
-        if resp.status_code == 400:
+        return self._check_origami_server_response(resp.status_code,
+                                                   resp.text)
+
+    def _check_origami_server_response(self, status_code, text):
+        """
+        Checks the status code of a response from the origami server.
+
+        Args:
+            status_code (int): HTTP status code of the response.
+            text (str): Response body as text.
+
+        Returns:
+            response_text: text, if the request was successful.
+
+        Raises:
+            BadRequestException:
+                400 when requesting
+            NotFoundRequestException:
+                404 when requesting
+            InternalServerErrorException:
+                500 when requesting
+            OrigamiRequesterException:
+                Some other error code when requesting
+        """
+        if status_code == 400:
             raise exceptions.BadRequestException(
                 "Bad Request: 400 when sending data to origami server")
-        elif resp.status_code == 404:
+        elif status_code == 404:
             raise exceptions.NotFoundRequestException(
                 "Not Found: 404 when sending data to origami server")
-        elif resp.status_code == 500:
+        elif status_code == 500:
             raise exceptions.InternalServerErrorException(
                 "Internal Server Error: 500 when requesting origami server")
-        elif resp.status_code == 200:
-            return resp.text
+        elif status_code == 200:
+            return text
         else:
             raise exceptions.OrigamiRequesterException(
                 "Connection error when requesting origami server")
 
+    def _get_requester_io_loop(self):
+        """
+        IOLoop on which asynchronous requests to the origami server are made,
+        this is the loop started by Origami.run() or else the current one if
+        it is running.
+
+        Raises:
+            OrigamiRequesterException: Origami.run() was not called and the \
+                caller is not on a running IOLoop, the request would never \
+                be made.
+        """
+        io_loop = self._requester_io_loop
+        if io_loop is not None:
+            return io_loop
+
+        io_loop = IOLoop.current(instance=False)
+        # Only the asyncio based loops tell whether they are running.
+        asyncio_loop = getattr(io_loop, "asyncio_loop", None)
+        if io_loop is None or \
+                (asyncio_loop is not None and not asyncio_loop.is_running()):
+            raise exceptions.OrigamiRequesterException(
+                "No running IOLoop to request the origami server from, call "
+                "it from a coroutine or once Origami.run() has started")
+        return io_loop
+
+    @gen.coroutine
+    def _fetch_origami_server(self, payload):
+        """
+        Coroutine making the POST request to the origami server using
+        tornados AsyncHTTPClient, must be run on the requester IOLoop.
+        """
+        target_url = self._get_cached_target_url()
+        self._update_requester_stats("requests")
+        try:
+            resp = yield AsyncHTTPClient().fetch(
+                target_url,
+                method="POST",
+                headers=constants.REQUESTS_JSON_HEADERS,
+                body=json.dumps(payload),
+                raise_error=False)
+        except Exception as e:
+            self._update_requester_stats("errors")
+            raise exceptions.OrigamiRequesterException(
+                "Connection error when requesting origami server : {}".format(
+                    e))
+
+        text = resp.body.decode("utf-8") if resp.body else ""
+        raise gen.Return(self._check_origami_server_response(resp.code, text))
+
+    def request_origami_server_async(self, payload):
+        """
+        Non blocking version of request_origami_server.
+
+        The request is made using tornados AsyncHTTPClient on the IOLoop of
+        the app, so the loop serving websockets and /fass is never blocked
+        waiting for the origami server. When called from the IOLoop thread
+        (a websocket handler or a coroutine) a tornado Future is returned
+        which can be yielded in a coroutine, from any other thread a
+        concurrent.futures.Future is returned which can be waited upon.
+
+        .. code-block:: python
+
+            @gen.coroutine
+            def on_result(self, payload):
+                resp = yield app.request_origami_server_async(payload)
+
+        Args:
+            payload: Python dict which is to be sent to the origami server, \
+                see request_origami_server for the format.
+
+        Returns:
+            future: Future resolving to the response text, or to one of the \
+                exceptions raised by request_origami_server.
+
+        Raises:
+            OrigamiRequesterException: Called before Origami.run() from \
+                outside a running IOLoop.
+        """
+        io_loop = self._get_requester_io_loop()
+        if IOLoop.current(instance=False) is io_loop:
+            return self._fetch_origami_server(payload)
+
+        future = futures.Future()
+
+        def _start_fetch():
+            chain_future(self._fetch_origami_server(payload), future)
+
+        io_loop.add_callback(_start_fetch)
+        return future
+
 
 class OrigamiInputs(object):
     """ Origami input functions
     Class implementing input functions for Origami, this class will be
     inherited by main Origami class.
+
+    Attributes:
+        image_decoder_pool_size: Threads decoding the images of a \
+            get_image_array call in parallel.
+        cache_path: Global cache path for the caches created for inputs.
+        cache_hash_algorithm: Hash algorithm naming the image blobs of the \
+            caches created for inputs.
     """
+    image_decoder_pool_size = constants.IMAGE_DECODER_POOL_SIZE
+    cache_path = constants.GLOBAL_CACHE_PATH
+    cache_hash_algorithm = constants.DEFAULT_BLOB_HASH_ALGORITHM
+    _image_decoder_pool = None
+    memory_cache = None
+    cache_backend = None
 
     def __init__(self):
         pass
 
+    def _get_image_decoder_pool(self):
+        """
+        Returns the ImageCodecPool of the app used to decode input images,
+        creating it on first use.
+        """
+        with _pool_lock:
+            if self._image_decoder_pool is None:
+                self._image_decoder_pool = ImageCodecPool(
+                    self.image_decoder_pool_size)
+        return self._image_decoder_pool
+
+    def get_image_decoder_stats(self):
+        """
+        Statistics for decoding input images, see ImageCodecPool.get_stats.
+
+        Returns:
+            stats (dict): Images decoded, time spent decoding and the time \
+                taken by each image of the last get_image_array call.
+        """
+        return self._get_image_decoder_pool().get_stats()
+
+    def get_cache_memory_stats(self):
+        """
+        Statistics of the in memory tier of the caches, see
+        OrigamiMemoryCache.get_stats.
+
+        Returns:
+            stats (dict): Hits, misses, evictions and memory used, None if \
+                the app has no memory tier.
+        """
+        if self.memory_cache is None:
+            return None
+        return self.memory_cache.get_stats()
+
     def get_text_array(self):
         """
         Extract text input from the request form.
@@ -129,10 +497,14 @@ class OrigamiInputs(object):
             raise exceptions.InvalidRequestParameterGet(
                 "No valid input text fields in the request")
 
-    def get_image_array(self, mode=constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE):
+    def get_image_array(self,
+                        mode=constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE,
+                        max_dimension=None,
+                        grayscale=False,
+                        keep_alpha=False):
         """
         Extract image input from the request files.
-        The two modes defines how the user wants the images
+        The modes defines how the user wants the images
 
         file_path: The file_path mode which is the default one makes use of \
             OrigamiCache. It creates a cache object and then store the images \
@@ -142,12 +514,24 @@ class OrigamiInputs(object):
             The load function will return a list of file_paths which will each
             corresponding to the image.
 
+        lazy: Returns an OrigamiImage handle for each image, bytes, decoded \
+            array, dimensions and cached file path are only computed when \
+            asked for from the handle.
+
         Args:
             mode: mode in which you are expecting the result
 
                 * file_path -> cache Image locally and return path
                 * numpy_array -> processes the image and returns the numpy \
-                    array corresponding to that.
+                    array corresponding to that. Images are decoded in \
+                    parallel by the decoder pool of the app.
+                * lazy -> returns an OrigamiImage handle for each image.
+            max_dimension (int): numpy_array mode only, decode the image \
+                reduced by 2, 4 or 8 while keeping its longer side at least \
+                max_dimension. JPEGs are scaled in the DCT domain so the full \
+                size image is never decoded.
+            grayscale (bool): numpy_array mode only, decode to grayscale.
+            keep_alpha (bool): numpy_array mode only, keep the alpha channel.
 
         Returns:
             ImageArr: array of Images either in the numpy array format or \
@@ -170,13 +554,33 @@ class OrigamiInputs(object):
                     "No valid input image fields in the request : {}".format(e))
 
         if mode == constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE:
-            cache = OrigamiCache()
+            cache = OrigamiCache(
+                cache_path=self.cache_path,
+                hash_algorithm=self.cache_hash_algorithm,
+                memory_cache=self.memory_cache,
+                backend=self.cache_backend)
             cache.save_image_file_array_to_cache(image_inputs)
             image_path_arr = cache.load_image_file_paths_from_cache()
             return image_path_arr
 
         elif mode == constants.INPUT_IMAGE_ARRAY_NPARRAY_MODE:
-            return utils.get_image_as_numpy_arr(image_inputs)
+            decode = functools.partial(
+                utils.decode_image_object,
+                max_dimension=max_dimension,
+                grayscale=grayscale,
+                keep_alpha=keep_alpha)
+            return self._get_image_decoder_pool().map(decode, image_inputs)
+
+        elif mode == constants.INPUT_IMAGE_ARRAY_LAZY_MODE:
+            lazy_cache = LazyImageCache(
+                cache_path=self.cache_path,
+                hash_algorithm=self.cache_hash_algorithm,
+                memory_cache=self.memory_cache,
+                backend=self.cache_backend)
+            return [
+                OrigamiImage(image_object, lazy_cache)
+                for image_object in image_inputs
+            ]
         else:
             raise exceptions.InputHandlerException(
                 "No valid mode provided when requesting user image input")
@@ -189,8 +593,22 @@ class OrigamiOutputs(OrigamiRequester):
     Attributes:
         response: response variable storing response to be sent to client \
             if API access is enabled using the provided decorator.
+        coalesce_outputs: If True outputs sent to the origami server during \
+            a request are buffered and sent as a single inject request by \
+            flush().
+        image_encoding_format: Default format(jpeg, png or webp) for \
+            encoding numpy images in send_image_array.
+        image_encoding_quality: Default quality for encoding numpy images, \
+            None uses the OpenCV default.
+        image_encoder_pool_size: Threads encoding the images of a \
+            send_image_array call in parallel.
     """
     response = list(constants.DEFAULT_ORIGAMI_RESPONSE_TEMPLATE)
+    coalesce_outputs = False
+    image_encoding_format = constants.DEFAULT_IMAGE_ENCODING_FORMAT
+    image_encoding_quality = constants.DEFAULT_IMAGE_ENCODING_QUALITY
+    image_encoder_pool_size = constants.IMAGE_ENCODER_POOL_SIZE
+    _image_encoder_pool = None
 
     def __init__(self):
         pass
@@ -238,11 +656,61 @@ class OrigamiOutputs(OrigamiRequester):
 
         def _wrapper():
             view_func()
+            self.flush()
             response = self._clear_response()
             return response
 
         return _wrapper
 
+    def flush(self):
+        """
+        Sends all the outputs buffered for the current request to the origami
+        server as a single inject request. This is called by origami_api once
+        the wrapped function returns, call it explicitly to send partial
+        results early.
+
+        Outputs are only buffered when coalesce_outputs is enabled for the
+        app. A buffer with a single output is sent as a regular payload,
+        several outputs are sent as a multipart payload
+
+        .. code-block
+
+            {
+                "socketId": userSocketID,
+                "multipart": [
+                    {"[dataType]": data},
+                    ...
+                ]
+            }
+
+        Returns:
+            resp: Response text from the origami server, None if nothing \
+                was buffered.
+        """
+        if not has_request_context():
+            return None
+
+        buffered = g.pop(_OUTPUT_BUFFER_KEY, None)
+        if not buffered:
+            return None
+
+        parts_by_socket = OrderedDict()
+        for socketId, dataType, data in buffered:
+            parts_by_socket.setdefault(socketId, []).append({dataType: data})
+
+        resp = None
+        for socketId, parts in parts_by_socket.items():
+            if len(parts) == 1:
+                payload = dict(parts[0], socketId=socketId)
+            else:
+                payload = {
+                    "socketId": socketId,
+                    constants.MULTIPART_DATA_TYPE_KEY: parts
+                }
+            resp = self._inject_payload(payload)
+
+        return resp
+
     def _origmai_send_data(self, data, dataType, socketId=None):
         """
         Core function which sends output to either the origami server or the
@@ -255,7 +723,8 @@ class OrigamiOutputs(OrigamiRequester):
 
         Returns:
             resp: Response we sent to user as API response or response from
-                the origami server.
+                the origami server, None if the output was buffered. A future
+                for the response when the inject queue is enabled.
         """
         resp = None
         socketId = socketId if socketId else user_req.form.get(
@@ -263,10 +732,16 @@ class OrigamiOutputs(OrigamiRequester):
         # Check if a valid socketId is provided in the request
         # else consider it as an API request.
 
-        if socketId:
+        if socketId and self.coalesce_outputs and has_request_context():
+            # Buffer the output, it is sent along with the other outputs of
+            # this request when flush() is called.
+            g.setdefault(_OUTPUT_BUFFER_KEY, []).append((socketId, dataType,
+                                                         data))
+
+        elif socketId:
             # Check if the socket-id is there is the request form.
             payload = {"socketId": socketId, dataType: data}
-            resp = self.request_origami_server(payload)
+            resp = self._inject_payload(payload)
 
         else:
             # TODO: Discuss the strucutre of API response payload.
@@ -275,6 +750,36 @@ class OrigamiOutputs(OrigamiRequester):
 
         return resp
 
+    def _origami_send_data_async(self, data, dataType, socketId=None):
+        """
+        Non blocking version of _origmai_send_data, the data is injected to
+        the origami server using request_origami_server_async.
+
+        Outside of a user request (for example from a websocket handler or a
+        background thread) socketId must be provided.
+
+        Returns:
+            future: Future resolving to the response text from the origami \
+                server or the API response.
+        """
+        if not socketId and has_request_context():
+            socketId = user_req.form.get(
+                constants.REQUEST_SOCKET_ID_KEY, type=str)
+
+        if socketId:
+            payload = {"socketId": socketId, dataType: data}
+            return self.request_origami_server_async(payload)
+
+        future = Future()
+        if has_request_context():
+            future.set_result(self._send_api_response({"data": data}))
+        else:
+            future.set_exception(
+                exceptions.OutputHandlerException(
+                    "A socketId is required to send data outside of a request"
+                ))
+        return future
+
     # Data sending functions
 
     def send_text_array(self, data, dataType=constants.DEFAULT_DATA_TYPE_KEY):
@@ -302,22 +807,34 @@ class OrigamiOutputs(OrigamiRequester):
         resp = self._origmai_send_data(data, dataType)
         return resp
 
-    def send_graph_array(self, data):
+    def send_text_array_async(self,
+                              data,
+                              dataType=constants.DEFAULT_DATA_TYPE_KEY,
+                              socketId=None):
         """
-        Send text data array to origami_server with the users socket ID
+        Non blocking version of send_text_array.
 
         Args:
-            data (list, tuple): list or tuple of list/tuple to be sent.
+            data: list or tuple of string to be sent.
+            dataType: Key for data in payload python dict \
+                can be either of data or terminalData
+            socketId: socket ID of the user, required outside of a request.
 
         Returns:
-            resp: Response text we got back from the origami server \
-                corresponding to the request we made.
+            future: Future resolving to the response text from the origami \
+                server.
+        """
+        utils.strict_check_array_of_string(data)
+        return self._origami_send_data_async(data, dataType, socketId)
+
+    def _check_graph_array(self, data):
+        """
+        Checks that data is a list/tuple of list/tuple.
 
         Raises:
             MismatchTypeException: Type of the data provided to function is \
                 not what we expected.
         """
-
         if not isinstance(data, (list, tuple)):
             raise exceptions.MismatchTypeException(
                 "send_graph_array can only accept an array or a tuple.")
@@ -326,9 +843,42 @@ class OrigamiOutputs(OrigamiRequester):
             raise exceptions.MismatchTypeException(
                 "send_graph_array expects a list/tuple of list/tuple")
 
+    def send_graph_array(self, data):
+        """
+        Send text data array to origami_server with the users socket ID
+
+        Args:
+            data (list, tuple): list or tuple of list/tuple to be sent.
+
+        Returns:
+            resp: Response text we got back from the origami server \
+                corresponding to the request we made.
+
+        Raises:
+            MismatchTypeException: Type of the data provided to function is \
+                not what we expected.
+        """
+        self._check_graph_array(data)
+
         resp = self._origmai_send_data(data, constants.DEFAULT_DATA_TYPE_KEY)
         return resp
 
+    def send_graph_array_async(self, data, socketId=None):
+        """
+        Non blocking version of send_graph_array.
+
+        Args:
+            data (list, tuple): list or tuple of list/tuple to be sent.
+            socketId: socket ID of the user, required outside of a request.
+
+        Returns:
+            future: Future resolving to the response text from the origami \
+                server.
+        """
+        self._check_graph_array(data)
+        return self._origami_send_data_async(
+            data, constants.DEFAULT_DATA_TYPE_KEY, socketId)
+
     def send_text_array_to_terminal(self, data):
         """
         Send the array/tuple provided as argument to the origami server
@@ -343,18 +893,52 @@ class OrigamiOutputs(OrigamiRequester):
         resp = self.send_text_array(data, constants.TERMINAL_DATA_TYPE_KEY)
         return resp
 
-    def send_image_array(self,
-                         data,
-                         mode=constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE):
+    def send_text_array_to_terminal_async(self, data, socketId=None):
         """
-        Send image array as base64 encoded images list.
+        Non blocking version of send_text_array_to_terminal.
+
+        Returns:
+            future: Future resolving to the response got from sending the data.
+        """
+        return self.send_text_array_async(
+            data, constants.TERMINAL_DATA_TYPE_KEY, socketId)
+
+    def _get_image_encoder_pool(self):
+        """
+        Returns the ImageCodecPool of the app used to encode output images,
+        creating it on first use.
+        """
+        with _pool_lock:
+            if self._image_encoder_pool is None:
+                self._image_encoder_pool = ImageCodecPool(
+                    self.image_encoder_pool_size)
+        return self._image_encoder_pool
+
+    def get_image_encoder_stats(self):
+        """
+        Statistics for encoding output images, see ImageCodecPool.get_stats.
+
+        Returns:
+            stats (dict): Images encoded, time spent encoding and the time \
+                taken by each image of the last send_image_array call.
+        """
+        return self._get_image_encoder_pool().get_stats()
+
+    def _encode_image_array(self, data, mode, image_format=None,
+                            quality=None):
+        """
+        Encodes a list/tuple of images as base64 encoded image strings.
 
         Args:
             data (list, tuple): list/tuple of either image path or numpy array
             mode (str): mode in which to process the data
+            image_format (str): format to encode numpy arrays in, defaults \
+                to image_encoding_format of the app.
+            quality (int): encoding quality for numpy arrays, defaults to \
+                image_encoding_quality of the app.
 
         Returns:
-            resp: response got from sending the data.
+            image_arr: list of base64 encoded images.
 
         Raises:
             MismatchTypeException: data is not of list/tuple type
@@ -363,29 +947,89 @@ class OrigamiOutputs(OrigamiRequester):
             raise exceptions.MismatchTypeException(
                 "send_image_array can only accept a list or a tuple.")
 
-        image_arr = []
+        encoder_pool = self._get_image_encoder_pool()
 
         # Mode -> file_path
         if mode == constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE:
-            for file_path in data:
-                img_src = utils.get_base64_image_from_file(file_path)
-                image_arr.append(img_src)
+            image_arr = encoder_pool.map(utils.get_base64_image_from_file,
+                                         data)
 
         # Mode -> NP Array
         elif mode == constants.INPUT_IMAGE_ARRAY_NPARRAY_MODE:
-            for np_image_arr in data:
-                img_src = utils.get_base64_image_from_nparr(np_image_arr)
-                image_arr.append(img_src)
+            image_format = image_format or self.image_encoding_format
+            if quality is None:
+                quality = self.image_encoding_quality
+
+            def _encode(np_image_arr):
+                return utils.get_base64_image_from_nparr(
+                    np_image_arr, image_format, quality)
+
+            image_arr = encoder_pool.map(_encode, data)
 
         else:
             raise exceptions.OutputHandlerException(
                 "Not a valid mode({0}) provided when encoding image \
                 for sending", mode)
 
+        return image_arr
+
+    def send_image_array(self,
+                         data,
+                         mode=constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE,
+                         image_format=None,
+                         quality=None):
+        """
+        Send image array as base64 encoded images list.
+
+        Numpy arrays are encoded in memory in image_format(jpeg, png or webp)
+        with the given quality, which default to the image_encoding_format
+        and image_encoding_quality of the app.
+
+        Args:
+            data (list, tuple): list/tuple of either image path or numpy array
+            mode (str): mode in which to process the data
+            image_format (str): format to encode numpy arrays in.
+            quality (int): quality(0-100) for jpeg and webp, compression \
+                level(0-9) for png.
+
+        Returns:
+            resp: response got from sending the data.
+
+        Raises:
+            MismatchTypeException: data is not of list/tuple type
+        """
+        image_arr = self._encode_image_array(data, mode, image_format,
+                                             quality)
+
         resp = self._origmai_send_data(image_arr,
                                        constants.DEFAULT_DATA_TYPE_KEY)
         return resp
 
+    def send_image_array_async(self,
+                               data,
+                               mode=constants.INPUT_IMAGE_ARRAY_FILEPATH_MODE,
+                               socketId=None,
+                               image_format=None,
+                               quality=None):
+        """
+        Non blocking version of send_image_array, only the request to the
+        origami server is asynchronous, images are encoded before returning.
+
+        Args:
+            data (list, tuple): list/tuple of either image path or numpy array
+            mode (str): mode in which to process the data
+            socketId: socket ID of the user, required outside of a request.
+            image_format (str): format to encode numpy arrays in.
+            quality (int): encoding quality for numpy arrays.
+
+        Returns:
+            future: Future resolving to the response got from sending the data.
+        """
+        image_arr = self._encode_image_array(data, mode, image_format,
+                                             quality)
+        return self._origami_send_data_async(
+            image_arr, constants.DEFAULT_DATA_TYPE_KEY, socketId)
+
 
 class OrigamiWebSocketHandler(WebSocketHandler):
     """
@@ -393,8 +1037,9 @@ class OrigamiWebSocketHandler(WebSocketHandler):
 
     Attributes:
         persistent_conn_map:
-            This is a list of object containing information about each \
-            registered persistent connection. The structure of the object is:
+            This is a ConnectionRegistry containing information about each \
+            registered persistent connection keyed by socket-id. The \
+            structure of each entry is:
 
             .. code-block
 
@@ -409,18 +1054,23 @@ class OrigamiWebSocketHandler(WebSocketHandler):
             * `func`: routine to execute when the request from websocket is made
             * `arguments`: a list of arguments to be provided to func.
             * `timestamp`: Timestamp when the function with is registered in \
-                the map. This will be used in the case when we deploy regular
-                cleaning of the connection maps.
+                the map.
 
             Each time a user connection is registered an entry is made in this
-            mapping list. An entry from the map is deleted when the client
-            closes the websocket for the connection.
+            mapping. An entry from the map is deleted when the client closes
+            the websocket for the connection, with persistent_conn_ttl the
+            entries not used for that long are also swept regularly.
+
+        function_executor:
+            FunctionExecutor running the registered functions off the \
+            IOLoop, so a slow function does not hold up the other \
+            connections. The messages of a websocket are still handled one \
+            at a time, in order.
     """
     # A persistent connection mapping.
     # Static variable, a single copy for all the connection.
-    # TODO: Run a worker to regularly clean this global mapping, might get too
-    # bloated
-    persistent_conn_map = []
+    persistent_conn_map = ConnectionRegistry()
+    function_executor = _function_executor
 
     def register_persistent_connection(self, func, args):
         """
@@ -493,20 +1143,8 @@ class OrigamiWebSocketHandler(WebSocketHandler):
         socketId = user_req.form.get(constants.REQUEST_SOCKET_ID_KEY, type=str)
 
         if socketId:
-            try:
-                # Try to check if a connection with the give socket-id already
-                # exist
-                dup_conn = next(
-                    x for x in self.persistent_conn_map if x["id"] == socketId)
-                self.__clear_connection(dup_conn)
-            except StopIteration:
-                # No connection with the socket ID found.
-                self.persistent_conn_map.append({
-                    "id": socketId,
-                    "func": func,
-                    "arguments": args,
-                    "timestamp": time.time()
-                })
+            # Replaces the connection already registered with the socket-id.
+            self.persistent_conn_map.register(socketId, func, args)
             return True
         else:
             # This is the case when the user is requesting without socket-id
@@ -526,17 +1164,12 @@ class OrigamiWebSocketHandler(WebSocketHandler):
     def __clear_connection(self, conn=None):
         """
         Clear the active connection from the persistent connection map.
-        Remove the object self.active_connection from the list
-        persistent_connections_map
+        Remove the object self.active_connection from the map
+        persistent_conn_map, unless the socket-id was registered again since.
         """
         conn = conn if conn else self.active_connection
         if conn:
-            try:
-                dup_conn = next(x for x in self.persistent_conn_map
-                                if x["id"] == conn["id"])
-                self.persistent_conn_map.remove(dup_conn)
-            except StopIteration:
-                pass
+            self.persistent_conn_map.remove(conn["id"], conn)
 
     def __reset_connection(self):
         """
@@ -570,9 +1203,10 @@ class OrigamiWebSocketHandler(WebSocketHandler):
             if constants.REQUEST_SOCKET_ID_KEY in message:
                 socketId = message[constants.REQUEST_SOCKET_ID_KEY]
                 if not self.active_connection:
-                    self.active_connection = next(
-                        x for x in self.persistent_conn_map
-                        if x["id"] == socketId)
+                    self.active_connection = self.persistent_conn_map.get(
+                        socketId)
+                    if self.active_connection is None:
+                        raise StopIteration
                     self.connection_id = self.active_connection["id"]
 
                 elif self.active_connection and self.connection_id != socketId:
@@ -605,6 +1239,7 @@ class OrigamiWebSocketHandler(WebSocketHandler):
         """
         self.__reset_connection()
 
+    @gen.coroutine
     def on_message(self, message):
         """
         Got a messege from the websocket connection.
@@ -613,8 +1248,11 @@ class OrigamiWebSocketHandler(WebSocketHandler):
         This method recieves the message from the websocket connection and
         validates the message. If the message is validated it extracts the
         data from the message and pass it as an argument to the function
-        registered corresponding to the users socket-id. The returned value
-        from the function is sent back to user as a response.
+        registered corresponding to the users socket-id. The function runs in
+        the function executor and the returned value from the function is sent
+        back to user as a response once it completes. Tornado does not
+        deliver the next message of the websocket before that, so the
+        messages of a websocket are answered in order.
 
         Args:
             message: message from the websocket connection. \
@@ -624,8 +1262,10 @@ class OrigamiWebSocketHandler(WebSocketHandler):
         """
         data = self._validate_message(message)
         if data:
-            out_msg = self.active_connection["func"](
-                *self.active_connection["arguments"], message=data)
+            self.persistent_conn_map.touch(self.connection_id)
+            conn = self.active_connection
+            out_msg = yield self.function_executor.submit(
+                conn["func"], *conn["arguments"], message=data)
             try:
                 # Send the out_msg returned from the function.
                 if isinstance(out_msg, dict):
@@ -655,21 +1295,33 @@ class FunctionServiceHandler(RequestHandler):
     """
     Handles persistent calls to function.
 
-    The const MAX_CONN_LIMIT here defines the maximum no of
-    simultaneous http connection we support, the default is 32
+    The const MAX_CONN_LIMIT here defines the default maximum no of
+    registered http connection we hold, set it with fass_capacity. Once
+    full, registering a connection evicts the least recently used one, the
+    evictions are counted in functional_service_map.get_stats().
 
-    We are not using python list here since pop operations for them is
-    slow as compared to deque. It also acts as a similar iterable to list
-    so most of the methods we use with list are available for this too.
+    The connections are kept in a ConnectionRegistry keyed by identifier, so
+    a request to /fass finds its function in constant time.
+
+    The registered functions run in the function executor and at most
+    fass_limiter.max_in_flight of them at once, up to
+    fass_limiter.max_waiting more requests wait for their turn and the
+    requests beyond that are answered 503 with a Retry-After header.
 
     Attributes:
         MAX_CONN_LIMIT: maximum connections that we can hold.
 
-        functional_service_map: A list of connections maapings with functions \
-            and identifiers.
+        functional_service_map: A ConnectionRegistry of connections \
+            mappings with functions and identifiers.
+
+        function_executor: FunctionExecutor running the registered functions.
+
+        fass_limiter: RequestLimiter capping the calls running at once.
     """
-    MAX_CONN_LIMIT = 32
-    functional_service_map = deque(maxlen=MAX_CONN_LIMIT)
+    MAX_CONN_LIMIT = constants.FASS_CAPACITY
+    functional_service_map = ConnectionRegistry(capacity=MAX_CONN_LIMIT)
+    function_executor = _function_executor
+    fass_limiter = RequestLimiter()
 
     @classmethod
     def register_persistent_http_connection(cls, func, args):
@@ -752,23 +1404,33 @@ class FunctionServiceHandler(RequestHandler):
                 "Non callable argument for function")
 
         func_id = uuid.uuid4().hex
-        cls.functional_service_map.append({
-            "id": func_id,
-            "func": func,
-            "arguments": args,
-            "timestamp": time.time()
-        })
+        cls.functional_service_map.register(func_id, func, args)
         return func_id
 
+    @gen.coroutine
     def get(self):
         query = self.get_query_argument("query", None, True)
         func_id = self.get_query_argument("id", None, True)
         if query and func_id:
             try:
-                connection = next(x for x in self.functional_service_map
-                                  if x["id"] == func_id)
-                out_msg = connection["func"](
-                    *connection["arguments"], query=query)
+                connection = self.functional_service_map.get(func_id)
+                if connection is None:
+                    raise StopIteration
+                admitted = self.fass_limiter.acquire()
+                if admitted is None:
+                    self.set_status(503)
+                    self.set_header("Retry-After",
+                                    str(self.fass_limiter.retry_after))
+                    self.finish("Too many requests, retry later")
+                    return
+
+                yield admitted
+                try:
+                    out_msg = yield self.function_executor.submit(
+                        connection["func"], *connection["arguments"],
+                        query=query)
+                finally:
+                    self.fass_limiter.release()
                 try:
                     # Send the out_msg returned from the function.
                     if isinstance(out_msg, dict):
@@ -825,17 +1487,184 @@ class Origami(OrigamiInputs, OrigamiOutputs, OrigamiWebSocketHandler,
         origami_server_base: URL for origami server running.
         server: Flask server for origami
         cors: CORS for flask server running
+        cache_path: Global cache path for caching user inputs.
+        cache_hash_algorithm: hashlib algorithm naming cached image blobs, \
+            for example md5 or blake2b.
+        cache_manager: OrigamiCacheManager enforcing cache_max_size \
+            (bytes) and cache_ttl (seconds) on the caches, its sweeper runs \
+            every cache_sweep_interval seconds once the server is started. \
+            None if neither limit is set. Built on the directory of the \
+            cache backend, the limits are not supported by the sqlite one.
+        memory_cache: OrigamiMemoryCache shared by the caches of the app, \
+            holding up to cache_memory_budget bytes of the recently used \
+            cache data in memory. None if no budget is set.
+        cache_backend: OrigamiCacheBackend storing the caches of the app, \
+            created from a name(filesystem, shm or sqlite) or given as is. \
+            None for files under cache_path. The cache manager only handles \
+            the file system backends.
+        requester_pool_size: Keep-alive connections kept open to the origami \
+            server.
+        coalesce_outputs: Send all the outputs of a request to the origami \
+            server as a single multipart inject request.
+        inject_queue_size: Send outputs through a background queue of this \
+            size, send functions then return a future. 0 disables the queue.
+        inject_queue_workers: Threads draining the inject queue.
+        inject_queue_policy: Policy when the inject queue is full, one of \
+            block, drop_oldest or raise.
+        image_encoding_format: Format(jpeg, png or webp) numpy images are \
+            encoded in by send_image_array.
+        image_encoding_quality: Quality numpy images are encoded with.
+        image_encoder_pool_size: Threads shared by the app for encoding \
+            output images in parallel.
+        image_decoder_pool_size: Threads shared by the app for decoding \
+            input images in parallel, separate from the encoder threads.
+        persistent_conn_ttl: Seconds a persistent websocket connection is \
+            kept after it was last used, swept every \
+            persistent_conn_sweep_interval seconds once the server is \
+            started. The registry is shared by the apps of the process, \
+            None leaves it as is, by default the connections are kept \
+            until the websocket is closed.
+        function_executor_kind: Run the functions registered for persistent \
+            connections in a pool of threads or processes, thread or \
+            process. Functions and arguments must be picklable for process.
+        function_executor_workers: Threads or processes running the \
+            functions registered for persistent connections. The executor \
+            is shared by the apps of the process, it is only reconfigured \
+            when function_executor_kind or function_executor_workers is \
+            passed, by default it is a pool of threads.
+        fass_max_in_flight: Calls of /fass running at once.
+        fass_max_waiting: Calls of /fass waiting for one of the running ones \
+            to finish, the calls beyond that are answered 503.
+        fass_retry_after: Seconds in the Retry-After header of a 503. The \
+            limiter is shared by the apps of the process, the limits left \
+            None keep their current value, constants.FASS_* by default.
+        fass_capacity: Maximum registered http connections, the least \
+            recently used one is evicted to register a new one when full.
+        fass_ttl: Seconds a registered http connection is kept after it \
+            was last used, swept with the persistent websocket \
+            connections. The registry is shared by the apps of the \
+            process, fass_capacity and fass_ttl left None keep their \
+            current value, by default constants.FASS_CAPACITY connections \
+            kept until evicted.
+        args_store: ArgumentStore holding up to args_memory_budget bytes of \
+            the arguments registered for the websocket and http connections \
+            in memory, spilling the numpy arrays of the least recently used \
+            ones to .npy files under args_spill_path(cache_path by \
+            default). Shared by the apps of the process, a later app with \
+            a budget changes the budget of the store already installed. \
+            None if no app has set a budget.
     """
 
     def __init__(self,
                  name,
                  server_base=constants.ORIGAMI_SERVER_BASE_URL,
-                 cache_path=constants.GLOBAL_CACHE_PATH):
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 requester_pool_size=constants.REQUESTER_POOL_SIZE,
+                 coalesce_outputs=False,
+                 inject_queue_size=0,
+                 inject_queue_workers=constants.INJECT_QUEUE_WORKERS,
+                 inject_queue_policy=constants.INJECT_QUEUE_POLICY_BLOCK,
+                 image_encoding_format=constants.DEFAULT_IMAGE_ENCODING_FORMAT,
+                 image_encoding_quality=constants.
+                 DEFAULT_IMAGE_ENCODING_QUALITY,
+                 image_encoder_pool_size=constants.IMAGE_ENCODER_POOL_SIZE,
+                 image_decoder_pool_size=constants.IMAGE_DECODER_POOL_SIZE,
+                 cache_hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM,
+                 cache_max_size=None,
+                 cache_ttl=None,
+                 cache_sweep_interval=constants.CACHE_SWEEP_INTERVAL,
+                 cache_memory_budget=None,
+                 cache_backend=None,
+                 persistent_conn_ttl=None,
+                 persistent_conn_sweep_interval=constants.
+                 PERSISTENT_CONN_SWEEP_INTERVAL,
+                 function_executor_kind=None,
+                 function_executor_workers=None,
+                 fass_max_in_flight=None,
+                 fass_max_waiting=None,
+                 fass_retry_after=None,
+                 fass_capacity=None,
+                 fass_ttl=None,
+                 args_memory_budget=None,
+                 args_spill_path=None):
         """
         Inits class with provided arguments
         """
+        OrigamiRequester.__init__(
+            self,
+            pool_size=requester_pool_size,
+            inject_queue_size=inject_queue_size,
+            inject_queue_workers=inject_queue_workers,
+            inject_queue_policy=inject_queue_policy)
+        self.coalesce_outputs = coalesce_outputs
+        self.image_encoding_format = image_encoding_format
+        self.image_encoding_quality = image_encoding_quality
+        self.image_encoder_pool_size = image_encoder_pool_size
+        self.image_decoder_pool_size = image_decoder_pool_size
 
         self.app_name = name
+        self.cache_path = cache_path
+        self.cache_hash_algorithm = cache_hash_algorithm
+        self.cache_sweep_interval = cache_sweep_interval
+        self.memory_cache = None
+        if cache_memory_budget:
+            self.memory_cache = OrigamiMemoryCache(cache_memory_budget)
+        self.cache_backend = cache_backend
+        if cache_backend is not None and \
+                not isinstance(cache_backend, OrigamiCacheBackend):
+            self.cache_backend = create_cache_backend(
+                cache_backend, cache_path, cache_hash_algorithm)
+        self.cache_manager = None
+        if cache_max_size is not None or cache_ttl is not None:
+            managed_path = cache_path
+            if self.cache_backend is not None:
+                if not isinstance(self.cache_backend, FileSystemCacheBackend):
+                    raise exceptions.InvalidCacheConfigException(
+                        "cache_max_size and cache_ttl are not supported by "
+                        "the cache backend : {}".format(
+                            type(self.cache_backend).__name__))
+                # The shm backend keeps its caches out of cache_path.
+                managed_path = self.cache_backend.cache_path
+            self.cache_manager = OrigamiCacheManager(
+                managed_path, max_size=cache_max_size, ttl=cache_ttl)
+        if persistent_conn_ttl is not None:
+            self.persistent_conn_map.ttl = persistent_conn_ttl
+        self.persistent_conn_sweep_interval = persistent_conn_sweep_interval
+        if function_executor_kind is not None or \
+                function_executor_workers is not None:
+            if function_executor_kind is None:
+                function_executor_kind = self.function_executor.kind
+            if function_executor_workers is None:
+                function_executor_workers = self.function_executor.max_workers
+            self.function_executor.configure(function_executor_kind,
+                                             function_executor_workers)
+        if fass_max_in_flight is not None or fass_max_waiting is not None \
+                or fass_retry_after is not None:
+            if fass_max_in_flight is None:
+                fass_max_in_flight = self.fass_limiter.max_in_flight
+            if fass_max_waiting is None:
+                fass_max_waiting = self.fass_limiter.max_waiting
+            if fass_retry_after is None:
+                fass_retry_after = self.fass_limiter.retry_after
+            self.fass_limiter.configure(fass_max_in_flight, fass_max_waiting,
+                                        fass_retry_after)
+        if fass_capacity is not None:
+            self.functional_service_map.capacity = fass_capacity
+        if fass_ttl is not None:
+            self.functional_service_map.ttl = fass_ttl
+        # The registries and their store are shared by the process, the
+        # connections already accounted for must stay in the same store.
+        self.args_store = self.persistent_conn_map.args_store
+        if args_memory_budget:
+            if self.args_store is None:
+                self.args_store = ArgumentStore(
+                    args_memory_budget,
+                    spill_path=args_spill_path or cache_path)
+                atexit.register(self.args_store.close)
+            else:
+                self.args_store.max_bytes = args_memory_budget
+            self.persistent_conn_map.args_store = self.args_store
+            self.functional_service_map.args_store = self.args_store
         self.origami_server_base = server_base
         # self.token = validate_token(token)
         # self.target = parse_target(token)
@@ -919,6 +1748,15 @@ class Origami(OrigamiInputs, OrigamiOutputs, OrigamiWebSocketHandler,
                                    dict(fallback=http_server))])
 
             server.listen(port)
+            if self.cache_manager is not None:
+                self.cache_manager.start_sweeper(self.cache_sweep_interval)
+            sweep_interval_ms = self.persistent_conn_sweep_interval * 1000
+            for registry in (self.persistent_conn_map,
+                             self.functional_service_map):
+                if registry.ttl is not None:
+                    PeriodicCallback(registry.sweep,
+                                     sweep_interval_ms).start()
+            self._requester_io_loop = IOLoop.current()
             print("Origami server running on port: {}".format(port))
             IOLoop.instance().start()
         except OSError:
@@ -1,12 +1,176 @@
-import ast
-import cv2
-import hashlib
+from collections import OrderedDict, deque
+from concurrent import futures
+import functools
+import itertools
 import numpy as np
 import os
-import shutil
+import sys
+import tempfile
+import threading
 import uuid
+import weakref
 
 from . import constants, exceptions, utils
+from .backends import FileSystemCacheBackend
+
+
+# Locks serializing the writers and readers of each cache manifest within the
+# process, a lock lives as long as someone holds it.
+_cache_file_locks = weakref.WeakValueDictionary()
+_cache_file_locks_guard = threading.Lock()
+
+
+def _get_cache_file_lock(cache_id, name):
+    """
+    Returns:
+        lock: threading.Lock of the process for the manifest name of the \
+            cache cache_id.
+    """
+    with _cache_file_locks_guard:
+        lock = _cache_file_locks.get((cache_id, name))
+        if lock is None:
+            lock = threading.Lock()
+            _cache_file_locks[(cache_id, name)] = lock
+    return lock
+
+
+class OrigamiMemoryCache(object):
+    """ In memory LRU tier for OrigamiCache
+    Holds the text arrays, image manifests, raw image blobs and decoded
+    images of OrigamiCache objects in memory within a byte budget, the least
+    recently used entries are evicted once the budget is exceeded and
+    entries larger than the budget are never held. OrigamiCache writes
+    through to the disk, so the disk still has everything and large or
+    cold data is only on the disk.
+
+    A single memory cache is meant to be shared by all the OrigamiCache
+    objects of the app, so the hot caches are served from memory.
+
+    .. code-block:: python
+
+        memory_cache = OrigamiMemoryCache(max_bytes=256 * 1024**2)
+        cache = OrigamiCache(memory_cache=memory_cache)
+        cache.save_text_array_to_cache(["Hello, ", "World!"])
+        # Served from memory
+        cache.load_text_array_from_cache()
+        print(memory_cache.get_stats())
+
+    Attrs:
+        max_bytes: Byte budget for the entries held in memory.
+    """
+
+    def __init__(self, max_bytes=constants.MEMORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_group = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def get_size(value):
+        """
+        Approximate memory used by a value held in the cache.
+
+        Args:
+            value: numpy array, bytes or a list of strings.
+
+        Returns:
+            size (int): Size in bytes.
+        """
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(sys.getsizeof(x) for x in value)
+        return sys.getsizeof(value)
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple): Key of the entry, its first item is the group used \
+                by invalidate.
+
+        Returns:
+            value: Value held for the key, None if it is not in memory.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Hold a value in memory, evicting the least recently used entries to
+        stay within max_bytes. Values larger than max_bytes are not held.
+
+        Args:
+            key (tuple): Key of the entry, its first item is the group used \
+                by invalidate.
+            value: numpy array, bytes or a list of strings.
+        """
+        size = self.get_size(value)
+        with self._lock:
+            self.__remove(key)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self._keys_by_group.setdefault(key[0], set()).add(key)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self.__remove(oldest_key)
+                self._stats["evictions"] += 1
+
+    def __remove(self, key):
+        """
+        Removes an entry, must be called holding self._lock.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry[1]
+        group = self._keys_by_group.get(key[0])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._keys_by_group[key[0]]
+
+    def discard(self, key):
+        """
+        Drop the entry for key from memory if it is there.
+        """
+        with self._lock:
+            self.__remove(key)
+
+    def invalidate(self, group):
+        """
+        Drop all the entries of a group, like all the entries of a cache.
+
+        Args:
+            group: First item of the keys to drop.
+        """
+        with self._lock:
+            for key in list(self._keys_by_group.get(group, ())):
+                self.__remove(key)
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): `hits`, `misses`, `evictions`, `entries` held and \
+                `bytes` used out of `max_bytes`.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        stats["max_bytes"] = self.max_bytes
+        return stats
 
 
 class OrigamiCache(object):
@@ -18,7 +182,12 @@ class OrigamiCache(object):
     and since IO are resource expensive this does not essentially increases
     speed in any sense. The main use of this here is for persistence, this
     can be also for large amount of data wherein it is not possible to store
-    all of it in the memory.
+    all of it in the memory. An OrigamiMemoryCache can be provided to hold
+    the hot data in memory in front of the disk.
+
+    The data is stored by an OrigamiCacheBackend, files under the global
+    cache path by default. Image blobs are kept once in a content addressed
+    store shared by all the caches, see FileSystemCacheBackend.
 
     .. code-block:: python
 
@@ -31,15 +200,41 @@ class OrigamiCache(object):
         new_arr = cache.load_text_array_from_cache()
         print(new_arr)
 
+        # All the caches in a single SQLite database
+        backend = SQLiteCacheBackend("/tmp")
+        cache = OrigamiCache(backend=backend)
+
     Attrs:
         global_cache_path: Path for all the file interaction for pipeline \
             functions.
         cache_id: ID for the current cache object.
-        cache_dir: Cache dir corresponding to global_cache_path and cache_id.
+        cache_dir: Directory holding the files of the current cache.
+        hash_algorithm: hashlib algorithm used to name image blobs, for \
+            example md5 or blake2b.
+        cache_decoded_arrays: If True decoded images are stored as .npy \
+            next to their blob and loaded memory mapped afterwards.
+        memory_cache: OrigamiMemoryCache holding recently used data in \
+            memory, None to always go to the disk.
+        backend: OrigamiCacheBackend storing the data, cache_path, \
+            hash_algorithm and shared_blob_store are only used to create the \
+            default FileSystemCacheBackend when it is not provided.
     """
 
-    def __init__(self, cache_path=constants.GLOBAL_CACHE_PATH):
-        self.global_cache_path = utils.validate_cache_path(cache_path)
+    def __init__(self,
+                 cache_path=constants.GLOBAL_CACHE_PATH,
+                 hash_algorithm=constants.DEFAULT_BLOB_HASH_ALGORITHM,
+                 shared_blob_store=constants.SHARED_BLOB_STORE,
+                 cache_decoded_arrays=False,
+                 memory_cache=None,
+                 backend=None):
+        if backend is None:
+            backend = FileSystemCacheBackend(cache_path, hash_algorithm,
+                                             shared_blob_store)
+        self.backend = backend
+        self.global_cache_path = backend.cache_path
+        self.hash_algorithm = backend.hash_algorithm
+        self.cache_decoded_arrays = cache_decoded_arrays
+        self.memory_cache = memory_cache
         self.cache_id = ""
         self.cache_dir = ""
         self._create_cache()
@@ -57,25 +252,28 @@ class OrigamiCache(object):
                 cache.
         """
         self.cache_id = uuid.uuid4().hex
-        self.cache_dir = os.path.join(self.global_cache_path, self.cache_id)
-        try:
-            if not os.path.exists(self.cache_dir):
-                os.makedirs(self.cache_dir)
-        except OSError:
-            self.cache_dir = ""
-            raise exceptions.FileHandlingException(
-                "Error when creating directory for cache :: {}.".format(
-                    self.cache_dir))
+        self.cache_dir = ""
+        self.backend.create_cache(self.cache_id)
+        self.cache_dir = self.backend.get_cache_dir(self.cache_id)
 
         return self.cache_id
 
+    def _touch_cache(self):
+        """
+        Record an access to the cache, the cache manager evicts the least
+        recently accessed caches first.
+        """
+        self.backend.touch_cache(self.cache_id)
+
     def delete_current_cache(self):
         """
         Delete the cache identifiers, cache_id and cache_dir
         """
         try:
-            if self.cache_dir:
-                shutil.rmtree(self.cache_dir)
+            if self.cache_id:
+                if self.memory_cache is not None:
+                    self.memory_cache.invalidate(self.cache_id)
+                self.backend.delete_cache(self.cache_id)
                 self.cache_dir = ""
             self.cache_id = ""
         except Exception:
@@ -93,51 +291,75 @@ class OrigamiCache(object):
         cache_id = self._create_cache()
         return cache_id
 
-    def __write_python_list_to_file(self, file_path, text_array):
+    def __write_cache_file(self, name, entries):
         """
-        Takes a file path and a list of strings and writes the whole data
-        structure to the file. This file is internal to the class and hence
-        assumes that any argument provided to it must be sanitized and checked
-        for earlier.
-
-        This function does nothing more than just writing the data structure to
-        the file.
+        Takes a manifest name and a list of entries(strings) and writes them
+        to the cache, replacing the manifest atomically. This file is internal
+        to the class and hence assumes that any argument provided to it must
+        be sanitized and checked for earlier.
 
         Args:
-            file_path(str): Path to store the data to
-            text_array(list): A list of strings to be stored in the file.
+            name(str): Name of the manifest, text.cache or image.cache.
+            entries(list): A list of strings to be stored in the manifest.
         """
-        with open(file_path, "w") as file:
-            # Write it to the cache file as an array of string.
-            text_array = ['"{}"'.format(x) for x in text_array]
-            file.write('[' + ', '.join(text_array) + ']')
+        entries = list(entries)
+        with _get_cache_file_lock(self.cache_id, name):
+            self.backend.write_entries(self.cache_id, name, entries)
+            if self.memory_cache is not None:
+                self.memory_cache.put((self.cache_id, "file", name), entries)
 
-    def __read_from_file_as_python_list(self, file_path):
+    def __append_to_cache_file(self, name, entries):
         """
-        Takes a file_path(A cache file) and parses it for a python list using
-        ast module.
+        Appends entries to a manifest, only the new entries are written.
+        Appenders of the process are serialized, so concurrent appends never
+        corrupt the manifest.
 
         Args:
-            file_path: Path of the file to parse.
+            name(str): Name of the manifest.
+            entries(list): A list of strings to be appended.
+        """
+        with _get_cache_file_lock(self.cache_id, name):
+            if self.memory_cache is not None:
+                self.memory_cache.discard((self.cache_id, "file", name))
+            self.backend.append_entries(self.cache_id, name, entries)
+
+    def __read_cache_file(self, name):
+        """
+        Reads all the entries of a manifest as a python list. The entries
+        are served from the memory cache when it holds them.
 
         Raises:
-            MalformedCacheException: The cache file we are trying to parse is \
+            MalformedCacheException: The manifest we are trying to parse is \
                 malformed.
-            InvalidCachePathException: The path provided to read does not exist.
-        """
-        if os.path.exists(file_path):
-            with open(file_path, "r") as cache_file:
-                content = cache_file.read()
-                try:
-                    eval_ds = ast.literal_eval(content.strip())
-                    return eval_ds
-                except ValueError:
-                    raise exceptions.MalformedCacheException(
-                        "Text cache does not contain a valid string to be\
-                        evaluated")
-        else:
-            raise exceptions.InvalidCachePathException(
-                "No valid cache file found :: {}".format(file_path))
+            InvalidCachePathException: The manifest does not exist.
+        """
+        with _get_cache_file_lock(self.cache_id, name):
+            if self.memory_cache is None:
+                return list(self.backend.iter_entries(self.cache_id, name))
+
+            key = (self.cache_id, "file", name)
+            entries = self.memory_cache.get(key)
+            if entries is None:
+                entries = list(self.backend.iter_entries(self.cache_id, name))
+                self.memory_cache.put(key, entries)
+        # Callers own the list they get, the one in memory stays untouched.
+        return list(entries)
+
+    def compact_cache(self):
+        """
+        Rewrites the text and image manifests of the cache atomically in the
+        most compact form of the backend. For the file system backends legacy
+        cache files are converted and a line left incomplete by an
+        interrupted append is dropped, readers see either the old or the
+        compacted file.
+
+        Raises:
+            MalformedCacheException: A manifest contains a malformed entry.
+        """
+        self._touch_cache()
+        for name in (constants.TEXT_CACHE_FILE, constants.IMAGE_CACHE_FILE):
+            with _get_cache_file_lock(self.cache_id, name):
+                self.backend.compact_entries(self.cache_id, name)
 
     def save_text_array_to_cache(self, text_array):
         """
@@ -149,10 +371,22 @@ class OrigamiCache(object):
             text_array: array of strings to be saved in the text file cache.
         """
         utils.strict_check_array_of_string(text_array)
-        text_cache_path = os.path.join(self.cache_dir,
-                                       constants.TEXT_CACHE_FILE)
+        self._touch_cache()
+        self.__write_cache_file(constants.TEXT_CACHE_FILE, text_array)
+
+    def append_text_array_to_cache(self, text_array):
+        """
+        Takes an array of string and adds it after the text already in the
+        cache, only the new strings are written to the cache file so
+        sessions adding a few results at a time do not rewrite the whole
+        file each time.
 
-        self.__write_python_list_to_file(text_cache_path, text_array)
+        Args:
+            text_array: array of strings to be appended to the text cache.
+        """
+        utils.strict_check_array_of_string(text_array)
+        self._touch_cache()
+        self.__append_to_cache_file(constants.TEXT_CACHE_FILE, text_array)
 
     def load_text_array_from_cache(self):
         """
@@ -169,31 +403,71 @@ class OrigamiCache(object):
             InvalidCachePathException: The path for cache we obtained is not \
                 present or there is nothing to load fro the cache path.
         """
-        text_cache_path = os.path.join(self.cache_dir,
-                                       constants.TEXT_CACHE_FILE)
-
-        text_arr = self.__read_from_file_as_python_list(text_cache_path)
+        self._touch_cache()
+        text_arr = self.__read_cache_file(constants.TEXT_CACHE_FILE)
         return text_arr
 
-    def __create_blobs_from_image_objects(self, image_objects_arr):
+    def get_blob_refcount(self, blob_hash):
+        """
+        Number of caches referencing a blob, see the backend.
+
+        Args:
+            blob_hash: Hash of the blob.
+
+        Returns:
+            refcount (int): Caches referencing the blob.
+        """
+        return self.backend.get_blob_refcount(blob_hash)
+
+    def save_image_blob_to_cache(self, image_object):
+        """
+        Save a single image to the cache as a blob and append its hash to the
+        image cache file, the rest of the file is not rewritten. This is used
+        to write images to the cache on demand.
+
+        Args:
+            image_object: Image object to be saved.
+
+        Returns:
+            image_file_path: Path of the blob for the image, read only as \
+                it may be shared with other caches.
+
+        Raises:
+            BlobCreationException: Error while creating the blob.
+        """
+        self._touch_cache()
+        try:
+            blob_hash = self.backend.save_blob(self.cache_id, image_object)
+        except Exception as e:
+            raise exceptions.BlobCreationException(
+                "Exception occurred while creating blob from image object \
+                : {}".format(e))
+
+        self.__append_to_cache_file(constants.IMAGE_CACHE_FILE, [blob_hash])
+
+        return self.backend.get_blob_path(self.cache_id, blob_hash)
+
+    def __create_blobs_from_image_objects(self, image_objects_arr,
+                                          append=False):
         """
         Takes in an array of image_object like the one retrieved from the
-        request files and saves it to disk in the cache directory as a blob.
-        Each blob has a name which corresponds to the MD5 hash of the image
-        file. This ensures that no duplicate files are stored twice and uses
-        the same blobs for reference.
-
-        After saving the blobs to image blobs cache directory, it writes all the
-        blobs hash to a file image.cache which can then be used to lookup for
-        the available blobs. This file have a structure wherein it contains the
-        blobs in the form of python list. So to read this use the function
-        __read_from_file_as_python_list(). It will return
-        a python list of blobs hash.
+        request files and saves it as blobs with the backend. Each blob has a
+        name which corresponds to the hash of the image file. This ensures
+        that no duplicate files are stored twice and uses the same blobs for
+        reference.
+
+        After saving the blobs, it writes all the blobs hash to the manifest
+        image.cache which can then be used to lookup for the available blobs.
+        This manifest has the same format as the text cache with one blob
+        hash per entry. So to read this use the function __read_cache_file().
+        It will return a python list of blobs hash.
 
         Args:
             image_objects_arr: An array of image object(should be checked \
                 before here for type) which will be cached by creating blobs \
                 from the file.
+            append: Append the blobs hash to image.cache instead of \
+                replacing it.
 
         Returns:
             image_blobs_hash: A python list containing the blobs hash which \
@@ -204,31 +478,24 @@ class OrigamiCache(object):
                 be saved individually this exception is thrown when there is \
                 an error during this process for any image object.
         """
+        self._touch_cache()
         image_blobs_hash = []
-        image_cache_dir = os.path.join(self.cache_dir,
-                                       constants.IMAGE_BLOBS_DIR)
-        if not os.path.exists(image_cache_dir):
-            os.makedirs(image_cache_dir)
         try:
             for image_object in image_objects_arr:
-                image_object.seek(0)
-                blob_hash = hashlib.md5(image_object.read()).hexdigest()
-
-                image_blobs_hash.append(blob_hash)
-                image_blob_path = os.path.join(image_cache_dir, blob_hash)
-                with open(image_blob_path, "w+b") as file:
-                    image_object.seek(0)
-                    file.write(image_object.read())
-                    image_object.seek(0)
+                image_blobs_hash.append(
+                    self.backend.save_blob(self.cache_id, image_object))
 
         except Exception as e:
             raise exceptions.BlobCreationException(
                 "Exception occurred while creating blobs from image object \
                 array : {}".format(e))
 
-        image_cache_file = os.path.join(self.cache_dir,
-                                        constants.IMAGE_CACHE_FILE)
-        self.__write_python_list_to_file(image_cache_file, image_blobs_hash)
+        if append:
+            self.__append_to_cache_file(constants.IMAGE_CACHE_FILE,
+                                        image_blobs_hash)
+        else:
+            self.__write_cache_file(constants.IMAGE_CACHE_FILE,
+                                    image_blobs_hash)
 
         return image_blobs_hash
 
@@ -251,37 +518,236 @@ class OrigamiCache(object):
 
         return self.__create_blobs_from_image_objects(image_objects)
 
+    def append_image_file_array_to_cache(self, image_objects):
+        """
+        Save an array of image to the cache after the images already in it,
+        only the new blobs hash are written to image.cache.
+
+        Args:
+            image_objects: list/tuple of images to be saved.
+
+        Returns:
+            image_blobs_hash: Hash of the blobs of the new images.
+
+        Raises:
+            MismatchTypeException: Image objects in the argument should be a \
+                python list or a tuple.
+        """
+        if not isinstance(image_objects, (list, tuple)):
+            raise exceptions.MismatchTypeException(
+                "append_image_file_array_to_cache can only accept an array or "
+                "a tuple")
+
+        return self.__create_blobs_from_image_objects(
+            image_objects, append=True)
+
+    def __load_image_blobs_hash(self):
+        """
+        Returns:
+            blobs_hash: Hash of the blobs of the images in the cache, in order.
+        """
+        self._touch_cache()
+        return self.__read_cache_file(constants.IMAGE_CACHE_FILE)
+
     def load_image_file_paths_from_cache(self):
         """
-        Gives the list of image blobs paths from the cache.
+        Gives the list of image blobs paths from the cache. The blobs are
+        read only as they may be shared with other caches.
 
         Returns:
             image_file_paths: Image file paths stored in the cache as a list.
         """
-        image_cache_file_path = os.path.join(self.cache_dir,
-                                             constants.IMAGE_CACHE_FILE)
-        blob_hash_list = self.__read_from_file_as_python_list(
-            image_cache_file_path)
-
         image_file_paths = []
-        for blob_hash in blob_hash_list:
+        for blob_hash in self.__load_image_blobs_hash():
             image_file_paths.append(
-                os.path.join(self.cache_dir, constants.IMAGE_BLOBS_DIR,
-                             blob_hash))
+                self.backend.get_blob_path(self.cache_id, blob_hash))
 
         return image_file_paths
 
-    def load_image_nparr_from_cache(self):
+    def _load_image_nparr(self,
+                          blob_hash,
+                          max_dimension=None,
+                          grayscale=False,
+                          keep_alpha=False):
+        """
+        Decodes a cached image, with cache_decoded_arrays the decoded array
+        is stored as .npy next to the blob the first time and later loads
+        return a read only memory mapped view of it. With a memory cache the
+        decoded array is held in memory and a copy of it is returned, so the
+        caller can change it.
+
+        Args:
+            blob_hash: Hash of the image blob.
+            max_dimension, grayscale, keep_alpha: Decode options, see \
+                utils.get_imread_flags.
+
+        Returns:
+            image: Image as numpy array.
+        """
+        if self.memory_cache is None:
+            return self.__decode_image_nparr(blob_hash, max_dimension,
+                                             grayscale, keep_alpha)
+
+        key = (self.cache_id, "nparr", blob_hash, max_dimension or 0,
+               bool(grayscale), bool(keep_alpha))
+        image = self.memory_cache.get(key)
+        if image is not None:
+            return image.copy()
+
+        image = self.__decode_image_nparr(blob_hash, max_dimension,
+                                          grayscale, keep_alpha)
+        # Memory mapped arrays are already served from the page cache.
+        if image.ndim and not isinstance(image, np.memmap):
+            self.memory_cache.put(key, image)
+            return image.copy()
+        return image
+
+    def __read_image_blob(self, blob_hash):
+        """
+        Returns:
+            buf: Content of the blob as uint8 numpy array, from the memory \
+                cache if it is there, None if the cache has no such blob. \
+                Read only as it may be held in memory.
+        """
+        key = (self.cache_id, "blob", blob_hash)
+        if self.memory_cache is not None:
+            buf = self.memory_cache.get(key)
+            if buf is not None:
+                return buf
+
+        buf = self.backend.read_blob(self.cache_id, blob_hash)
+        if buf is not None:
+            buf.setflags(write=False)
+            if self.memory_cache is not None:
+                self.memory_cache.put(key, buf)
+        return buf
+
+    def __decode_image_nparr(self, blob_hash, max_dimension, grayscale,
+                             keep_alpha):
+        """
+        Decodes a cached image, see _load_image_nparr.
+        """
+        decode_options = {
+            "max_dimension": max_dimension,
+            "grayscale": grayscale,
+            "keep_alpha": keep_alpha
+        }
+        if not self.cache_decoded_arrays:
+            buf = self.__read_image_blob(blob_hash)
+            if buf is None:
+                return np.array(None)
+            return np.array(utils.decode_image_buffer(buf, **decode_options))
+
+        image_path = self.backend.get_blob_path(self.cache_id, blob_hash)
+        nparr_path = "{0}.{1}-{2:d}-{3:d}{4}".format(
+            image_path, max_dimension or 0, grayscale, keep_alpha,
+            constants.NPARR_CACHE_EXTENSION)
+        if os.path.exists(nparr_path):
+            try:
+                return np.load(nparr_path, mmap_mode="r")
+            except (IOError, OSError, ValueError):
+                # Not a valid array, decode the image again.
+                pass
+
+        image = utils.decode_image_file(image_path, **decode_options)
+        if image is None:
+            return np.array(image)
+
+        fd, tmp_nparr_path = tempfile.mkstemp(
+            prefix=constants.TMP_BLOB_PREFIX, dir=os.path.dirname(image_path))
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, image)
+            os.rename(tmp_nparr_path, nparr_path)
+        except (IOError, OSError):
+            if os.path.exists(tmp_nparr_path):
+                os.remove(tmp_nparr_path)
+            return image
+
+        return np.load(nparr_path, mmap_mode="r")
+
+    def load_image_nparr_from_cache(self,
+                                    max_dimension=None,
+                                    grayscale=False,
+                                    keep_alpha=False):
         """
         Gives the list of image as numpy array from the cache.
 
+        With cache_decoded_arrays the images are only decoded on the first
+        load, later loads return read only memory mapped arrays which are
+        served from the page cache and shared between processes.
+
+        Args:
+            max_dimension (int): Decode the image reduced by 2, 4 or 8 while \
+                keeping its longer side at least max_dimension, None for the \
+                full size.
+            grayscale (bool): Decode to a grayscale image.
+            keep_alpha (bool): Keep the alpha channel of the image.
+
         Returns:
             image_nparr_list: Image stored in the caches as numpy array.
         """
-        image_file_paths = self.load_image_file_paths_from_cache()
         image_nparr_list = []
-        for image_path in image_file_paths:
-            image = cv2.imread(image_path)
-            image_nparr_list.append(np.array(image))
+        for blob_hash in self.__load_image_blobs_hash():
+            image_nparr_list.append(
+                self._load_image_nparr(blob_hash, max_dimension, grayscale,
+                                       keep_alpha))
 
         return image_nparr_list
+
+    def iter_image_nparr_from_cache(self,
+                                    prefetch=constants.CACHE_PREFETCH_SIZE,
+                                    max_dimension=None,
+                                    grayscale=False,
+                                    keep_alpha=False):
+        """
+        Yields the images of the cache as numpy arrays one by one, in order.
+
+        Unlike load_image_nparr_from_cache only a few decoded images are held
+        at once, the next prefetch images are decoded by background threads
+        while the current one is used, overlapping the disk reads and the
+        decoding with the work done on the images.
+
+        .. code-block:: python
+
+            for image in cache.iter_image_nparr_from_cache(prefetch=4):
+                model.predict(image)
+
+        Args:
+            prefetch (int): Images decoded ahead of the one yielded, 0 to \
+                decode each image only when it is asked for.
+            max_dimension, grayscale, keep_alpha: Decode options, see \
+                load_image_nparr_from_cache.
+
+        Yields:
+            image: Next image stored in the cache as numpy array.
+        """
+        blobs_hash = iter(self.__load_image_blobs_hash())
+        decode = functools.partial(
+            self._load_image_nparr,
+            max_dimension=max_dimension,
+            grayscale=grayscale,
+            keep_alpha=keep_alpha)
+
+        if prefetch < 1:
+            for blob_hash in blobs_hash:
+                yield decode(blob_hash)
+            return
+
+        executor = futures.ThreadPoolExecutor(max_workers=prefetch)
+        pending = deque()
+        try:
+            for blob_hash in itertools.islice(blobs_hash, prefetch):
+                pending.append(executor.submit(decode, blob_hash))
+
+            while pending:
+                image = pending.popleft().result()
+                blob_hash = next(blobs_hash, None)
+                if blob_hash is not None:
+                    pending.append(executor.submit(decode, blob_hash))
+                yield image
+        finally:
+            # The consumer may stop early, do not decode the rest.
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
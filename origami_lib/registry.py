@@ -0,0 +1,503 @@
+from collections import OrderedDict
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+from . import constants
+
+
+class ConnectionRegistry(object):
+    """ Registry of the persistent connections of an app
+    Maps a connection id to the function registered for it, register, lookup
+    and removal take constant time whatever the number of connections.
+
+    Each entry is a dict with the following structure
+
+    .. code-block
+
+        {
+            "id": connection id,
+            "func": func,
+            "arguments": args,
+            "timestamp": time.time()
+        }
+
+    The entries are kept in the order they were last used, so with a ttl
+    the sweep only visits the entries it removes, and with a capacity the
+    least recently used entry is evicted when a new one does not fit.
+
+    .. code-block:: python
+
+        registry = ConnectionRegistry(ttl=3600, capacity=1024)
+        registry.register(socket_id, my_func, ["my argument"])
+        conn = registry.get(socket_id)
+        conn["func"](*conn["arguments"], message=message)
+
+        # Regularly
+        registry.sweep()
+
+    Attrs:
+        ttl: Seconds an entry is kept after it was last used, None to keep \
+            the entries until they are removed.
+        capacity: Maximum number of entries, None for no limit.
+        args_store: ArgumentStore accounting for the memory used by the \
+            arguments of the entries, None for no accounting.
+    """
+
+    def __init__(self, ttl=None, capacity=None, args_store=None):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.args_store = args_store
+        self._entries = OrderedDict()
+        self._last_access = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "registered": 0,
+            "removed": 0,
+            "expired": 0,
+            "evicted": 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, conn_id):
+        return conn_id in self._entries
+
+    def register(self, conn_id, func, args):
+        """
+        Register func with args for conn_id, replacing the entry already
+        registered for it. The least recently used entries are evicted if
+        the registry is over capacity.
+
+        Returns:
+            conn: The entry registered.
+        """
+        conn = {
+            "id": conn_id,
+            "func": func,
+            "arguments": args,
+            "timestamp": time.time()
+        }
+        dropped = []
+        with self._lock:
+            replaced = self._entries.pop(conn_id, None)
+            if replaced is not None:
+                dropped.append(replaced)
+            self._entries[conn_id] = conn
+            self._last_access[conn_id] = conn["timestamp"]
+            self._stats["registered"] += 1
+            while self.capacity is not None and \
+                    len(self._entries) > self.capacity:
+                oldest_id = next(iter(self._entries))
+                dropped.append(self._entries.pop(oldest_id))
+                del self._last_access[oldest_id]
+                self._stats["evicted"] += 1
+        self.__release_args(dropped)
+        if self.args_store is not None:
+            self.args_store.add(conn)
+        return conn
+
+    def __release_args(self, conns):
+        if self.args_store is not None:
+            for conn in conns:
+                self.args_store.discard(conn)
+
+    def get(self, conn_id):
+        """
+        Look up the entry of conn_id and mark it as used.
+
+        Returns:
+            conn: The entry, None if nothing is registered for conn_id.
+        """
+        with self._lock:
+            conn = self._entries.pop(conn_id, None)
+            if conn is None:
+                return None
+            self._entries[conn_id] = conn
+            self._last_access[conn_id] = time.time()
+        if self.args_store is not None:
+            self.args_store.touch(conn)
+        return conn
+
+    def touch(self, conn_id):
+        """
+        Mark the entry of conn_id as used, so it is not swept while the
+        connection is active.
+        """
+        self.get(conn_id)
+
+    def remove(self, conn_id, conn=None):
+        """
+        Remove the entry of conn_id.
+
+        Args:
+            conn_id: Connection id to remove.
+            conn: Only remove the entry if it is still this one, so an old \
+                connection does not remove the one registered after it.
+
+        Returns:
+            bool: True if an entry was removed.
+        """
+        with self._lock:
+            current = self._entries.get(conn_id)
+            if current is None or (conn is not None and current is not conn):
+                return False
+            del self._entries[conn_id]
+            del self._last_access[conn_id]
+            self._stats["removed"] += 1
+        self.__release_args([current])
+        return True
+
+    def sweep(self, now=None):
+        """
+        Remove the entries not used for more than ttl seconds.
+
+        Returns:
+            expired (int): Entries removed.
+        """
+        if self.ttl is None:
+            return 0
+        deadline = (now if now is not None else time.time()) - self.ttl
+        dropped = []
+        with self._lock:
+            while self._entries:
+                conn_id = next(iter(self._entries))
+                if self._last_access[conn_id] > deadline:
+                    break
+                dropped.append(self._entries.pop(conn_id))
+                del self._last_access[conn_id]
+            self._stats["expired"] += len(dropped)
+        self.__release_args(dropped)
+        return len(dropped)
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): Entries `registered`, `removed`, `expired` and \
+                `evicted` for capacity so far, the current `size` and the \
+                `capacity`.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        stats["capacity"] = self.capacity
+        return stats
+
+
+class ArgumentStore(object):
+    """ Memory budget for the arguments of registered connections
+    The arguments registered with a connection, often preprocessed images or
+    features, stay in memory as long as the connection is registered. The
+    store accounts for their size, numpy arrays by their nbytes, and once
+    the total goes over max_bytes the numpy arrays of the least recently
+    used connections are spilled to .npy files.
+
+    A spilled array is replaced in the arguments of all the connections
+    holding it by a single copy on write memory map of its file, so the
+    functions get it back transparently on their next call, read from the
+    page cache or the disk. An array shared by several connections is
+    counted and spilled once, and its spill file is deleted when the last
+    connection holding it is removed.
+
+    The objects of the caller are never changed, the lists, tuples and
+    dicts holding a spilled array are copied in the arguments of the
+    connection and the others are kept as is. Memory is only freed by a
+    spill once the caller no longer holds the arrays.
+
+    A single store is meant to be shared by the registries of the process.
+
+    .. code-block:: python
+
+        args_store = ArgumentStore(max_bytes=2 * 1024**3)
+        registry = ConnectionRegistry(args_store=args_store)
+        registry.register(socket_id, my_func, [features])
+        print(args_store.get_stats())
+
+    Attrs:
+        max_bytes: Memory budget for the arguments held in memory.
+        spill_path: Directory the spill files are written in, in a \
+            directory of their own created on the first spill.
+        min_spill_bytes: Smaller arrays are never spilled.
+    """
+
+    def __init__(self,
+                 max_bytes,
+                 spill_path=constants.GLOBAL_CACHE_PATH,
+                 min_spill_bytes=constants.ARGS_SPILL_MIN_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self.min_spill_bytes = min_spill_bytes
+        self._spill_dir = None
+        # id(conn) -> [conn, bytes of the arguments without their arrays,
+        # arrays held, spilled], in the order the connections were last used.
+        self._records = OrderedDict()
+        # Arrays of the arguments, each held once whatever the number of
+        # connections holding it.
+        self._arrays = {}
+        # id(array) -> key in self._arrays, checked against a weak reference
+        # as the id of a spilled array may be reused once it is freed.
+        self._array_keys = {}
+        self._next_array_key = 0
+        self._size = 0
+        # Bytes of the arrays being written to their spill file.
+        self._spilling_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"spills": 0, "spilled_bytes": 0}
+
+    @staticmethod
+    def get_size(value, memo=None, arrays=None):
+        """
+        Approximate memory used by an argument, numpy arrays are counted by
+        their nbytes and memory mapped ones are not counted. An object
+        referenced more than once is counted once.
+
+        Args:
+            value: Argument to measure.
+            memo: Set of the ids of the objects already counted.
+            arrays: Dict the numpy arrays are collected in by id instead of \
+                being counted, None to count them.
+
+        Returns:
+            size (int): Size in bytes.
+        """
+        if memo is None:
+            memo = set()
+        if id(value) in memo:
+            return 0
+        memo.add(id(value))
+        if isinstance(value, np.memmap):
+            return 0
+        if isinstance(value, np.ndarray):
+            if arrays is None:
+                return value.nbytes
+            arrays[id(value)] = value
+            return 0
+        if type(value) in (list, tuple):
+            return sys.getsizeof(value) + sum(
+                ArgumentStore.get_size(x, memo, arrays) for x in value)
+        if type(value) is dict:
+            return sys.getsizeof(value) + sum(
+                ArgumentStore.get_size(x, memo, arrays)
+                for x in value.values())
+        return sys.getsizeof(value)
+
+    @staticmethod
+    def __replace_array(value, replaced, spilled, memo):
+        """
+        Returns value with the array replaced by spilled. The lists, tuples
+        and dicts holding it are copied rather than changed, as the caller
+        may share them, the others are returned as is.
+        """
+        if value is replaced:
+            return spilled
+        if id(value) in memo:
+            return memo[id(value)]
+        memo[id(value)] = value
+        if type(value) in (list, tuple):
+            items = [
+                ArgumentStore.__replace_array(x, replaced, spilled, memo)
+                for x in value
+            ]
+            if any(x is not y for x, y in zip(items, value)):
+                memo[id(value)] = type(value)(items)
+        elif type(value) is dict:
+            items = dict(
+                (key, ArgumentStore.__replace_array(x, replaced, spilled,
+                                                    memo))
+                for key, x in value.items())
+            if any(items[key] is not x for key, x in value.items()):
+                memo[id(value)] = items
+        return memo[id(value)]
+
+    def __replace_in_holders(self, entry, replaced):
+        """
+        Replace an array by its memory map in the arguments of all the
+        connections holding it, must be called holding self._lock.
+        """
+        for record_key in entry["holders"]:
+            conn = self._records[record_key][0]
+            conn["arguments"] = self.__replace_array(
+                conn["arguments"], replaced, entry["memmap"], {})
+
+    def add(self, conn):
+        """
+        Account for the arguments of a newly registered connection, spilling
+        the arrays of the least recently used ones if over budget.
+        """
+        arrays = {}
+        size = self.get_size(conn["arguments"], arrays=arrays)
+        record_key = id(conn)
+        with self._lock:
+            array_keys = set()
+            already_spilled = []
+            for array_id, array in arrays.items():
+                array_key = self._array_keys.get(array_id)
+                entry = self._arrays.get(array_key)
+                if entry is None or entry["ref"]() is not array:
+                    array_key = self._next_array_key
+                    self._next_array_key += 1
+                    entry = self._arrays[array_key] = {
+                        "id": array_id,
+                        "array": array,
+                        "ref": weakref.ref(array),
+                        "nbytes": array.nbytes,
+                        "holders": set(),
+                        "memmap": None,
+                        "spill_file": None,
+                        "spilling": False
+                    }
+                    self._array_keys[array_id] = array_key
+                    self._size += array.nbytes
+                entry["holders"].add(record_key)
+                array_keys.add(array_key)
+                if entry["memmap"] is not None:
+                    already_spilled.append((array, entry["memmap"]))
+            for array, spilled in already_spilled:
+                conn["arguments"] = self.__replace_array(
+                    conn["arguments"], array, spilled, {})
+            self._records[record_key] = [conn, size, array_keys, False]
+            self._size += size
+            to_spill = self.__get_arrays_to_spill()
+        self.__spill(to_spill)
+
+    def touch(self, conn):
+        """
+        Mark the arguments of conn as used, they are spilled last.
+        """
+        with self._lock:
+            record = self._records.pop(id(conn), None)
+            if record is not None:
+                self._records[id(conn)] = record
+
+    def discard(self, conn):
+        """
+        Stop accounting for the arguments of a removed connection and delete
+        the spill files no other connection holds.
+        """
+        spill_files = []
+        with self._lock:
+            record = self._records.pop(id(conn), None)
+            if record is None:
+                return
+            self._size -= record[1]
+            for array_key in record[2]:
+                entry = self._arrays[array_key]
+                entry["holders"].discard(id(conn))
+                if entry["holders"]:
+                    continue
+                del self._arrays[array_key]
+                if self._array_keys.get(entry["id"]) == array_key:
+                    del self._array_keys[entry["id"]]
+                if entry["spill_file"] is not None:
+                    spill_files.append(entry["spill_file"])
+                else:
+                    self._size -= entry["nbytes"]
+        for spill_file in spill_files:
+            try:
+                os.remove(spill_file)
+            except OSError:
+                pass
+
+    def __get_spill_dir(self):
+        """
+        Must be called holding self._lock.
+        """
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(
+                prefix=constants.ARGS_SPILL_DIR_PREFIX, dir=self.spill_path)
+        return self._spill_dir
+
+    def __get_arrays_to_spill(self):
+        """
+        Picks the arrays of the least recently used connections to spill
+        until the total is within max_bytes, must be called holding
+        self._lock.
+
+        Returns:
+            to_spill: List of (array key, array, spill file).
+        """
+        to_spill = []
+        for record in list(self._records.values()):
+            if self._size - self._spilling_bytes <= self.max_bytes:
+                break
+            # The arguments of a connection are fixed once registered, what
+            # is left after a spill cannot be spilled.
+            if record[3]:
+                continue
+            record[3] = True
+            for array_key in record[2]:
+                entry = self._arrays[array_key]
+                array = entry["array"]
+                if array is None or entry["spilling"] or \
+                        array.dtype == object or \
+                        array.nbytes < self.min_spill_bytes:
+                    continue
+                entry["spilling"] = True
+                self._spilling_bytes += array.nbytes
+                spill_file = os.path.join(self.__get_spill_dir(),
+                                          uuid.uuid4().hex + ".npy")
+                to_spill.append((array_key, array, spill_file))
+        return to_spill
+
+    def __spill(self, to_spill):
+        """
+        Writes the arrays to their spill file, out of self._lock, then
+        replaces them by their memory map.
+        """
+        for array_key, array, spill_file in to_spill:
+            try:
+                np.save(spill_file, array)
+                spilled = np.load(spill_file, mmap_mode="c")
+            except (IOError, OSError):
+                spilled = None
+            with self._lock:
+                self._spilling_bytes -= array.nbytes
+                entry = self._arrays.get(array_key)
+                if entry is not None:
+                    entry["spilling"] = False
+                if entry is not None and spilled is not None:
+                    entry.update(array=None, memmap=spilled,
+                                 spill_file=spill_file)
+                    self.__replace_in_holders(entry, array)
+                    self._size -= array.nbytes
+                    self._stats["spills"] += 1
+                    self._stats["spilled_bytes"] += array.nbytes
+                    continue
+            # The spill failed or the connections holding the array were
+            # removed while it was written.
+            try:
+                os.remove(spill_file)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): `bytes` of arguments in memory out of \
+                `max_bytes`, `entries` accounted for, distinct `arrays` \
+                held, arrays spilled so far as `spills` and their \
+                `spilled_bytes`.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._records)
+            stats["arrays"] = len(self._arrays)
+            stats["bytes"] = self._size
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def close(self):
+        """
+        Delete all the spill files.
+        """
+        with self._lock:
+            spill_dir, self._spill_dir = self._spill_dir, None
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
@@ -1,11 +1,11 @@
 import base64
 import cv2
-import io
 import magic
 import numpy as np
 import os
+import struct
 import sys
-import uuid
+import threading
 
 from . import exceptions, constants
 
@@ -72,7 +72,210 @@ def parse_target(token):
     return target
 
 
-def get_image_as_numpy_arr(image_files_arr):
+# JPEG start of frame markers, they hold the dimensions of the image.
+_JPEG_SOF_MARKERS = frozenset(
+    [0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE,
+     0xCF])
+
+# cv2.imread flags indexed by grayscale and then the reduce factor.
+_IMREAD_REDUCED_FLAGS = {
+    False: {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    },
+    True: {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+    }
+}
+
+
+def get_image_buffer(image_object):
+    """
+    Returns the bytes of an uploaded image as a flat uint8 numpy array, with
+    at most one copy of the data.
+
+    For uploads held in a BytesIO the returned array is a read only view
+    over the value of the upload, which does not hold the BytesIO, so it
+    can still be closed or written to. For uploads spooled to a file the
+    data is read straight into a preallocated array. The position of the
+    stream is reset to the start afterwards.
+
+    Args:
+        image_object: Werkzeug FileStorage or a file like object.
+
+    Returns:
+        buf: uint8 numpy array with the content of the upload.
+    """
+    stream = getattr(image_object, "stream", image_object)
+    if hasattr(stream, "getvalue"):
+        # Unlike getbuffer, getvalue does not pin the buffer of the BytesIO
+        # and shares its bytes rather than copying them when it can.
+        buf = np.frombuffer(stream.getvalue(), dtype=np.uint8)
+        stream.seek(0)
+        return buf
+
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if hasattr(stream, "readinto"):
+        buf = np.empty(size, dtype=np.uint8)
+        read = stream.readinto(memoryview(buf))
+        buf = buf[:read]
+    else:
+        buf = np.frombuffer(stream.read(), dtype=np.uint8)
+    stream.seek(0)
+    return buf
+
+
+def get_image_dimensions_from_buffer(buf):
+    """
+    Reads the dimensions of a JPEG or PNG image from its header, without
+    decoding the image.
+
+    Args:
+        buf: bytes or uint8 numpy array with the content of the image.
+
+    Returns:
+        dimensions: (width, height) of the image, None if the format is not \
+            supported or the header is malformed.
+    """
+    buf = np.frombuffer(buf, dtype=np.uint8)
+    size = len(buf)
+    try:
+        if buf[:8].tobytes() == constants.PNG_MAGIC_NUMBER and size >= 24:
+            width, height = struct.unpack_from(">II", buf, 16)
+            return width, height
+
+        if buf[:3].tobytes() == constants.JPEG_MAGIC_NUMBER:
+            offset = 2
+            while offset + 9 <= size:
+                if buf[offset] != 0xFF:
+                    return None
+                marker = buf[offset + 1]
+                if marker == 0xFF:
+                    # Fill byte before a marker.
+                    offset += 1
+                elif marker in _JPEG_SOF_MARKERS:
+                    height, width = struct.unpack_from(">HH", buf, offset + 5)
+                    return width, height
+                elif marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                    # Markers without a length field.
+                    offset += 2
+                else:
+                    length = struct.unpack_from(">H", buf, offset + 2)[0]
+                    offset += 2 + length
+    except struct.error:
+        pass
+    return None
+
+
+def get_imread_flags(max_dimension=None,
+                     grayscale=False,
+                     keep_alpha=False,
+                     dimensions=None):
+    """
+    Returns the cv2.imread flags for decoding an image with the given options.
+
+    With max_dimension, the largest of the IMREAD_REDUCED_* flags which keeps
+    the longer side of the image at least max_dimension is chosen. For JPEG
+    these scale down in the DCT domain so the full size image is never
+    decoded. The image is only reduced by a factor of 2, 4 or 8, resizing to
+    the exact size is left to the caller.
+
+    Args:
+        max_dimension (int): Size the longer side of the image is needed at, \
+            None for the full size.
+        grayscale (bool): Decode to a single channel grayscale image.
+        keep_alpha (bool): Keep the alpha channel of the image, images with \
+            alpha are always decoded at full size.
+        dimensions (tuple): (width, height) of the image, required for \
+            reduced decoding.
+
+    Returns:
+        flags: Flags for cv2.imread/cv2.imdecode.
+
+    Raises:
+        InputHandlerException: grayscale and keep_alpha both requested.
+    """
+    if keep_alpha:
+        if grayscale:
+            raise exceptions.InputHandlerException(
+                "Cannot decode a grayscale image while keeping alpha")
+        return cv2.IMREAD_UNCHANGED
+
+    factor = 1
+    if max_dimension and dimensions:
+        longer_side = max(dimensions)
+        for reduce_factor in (8, 4, 2):
+            if longer_side // reduce_factor >= max_dimension:
+                factor = reduce_factor
+                break
+
+    return _IMREAD_REDUCED_FLAGS[grayscale][factor]
+
+
+def decode_image_buffer(buf,
+                        max_dimension=None,
+                        grayscale=False,
+                        keep_alpha=False):
+    """
+    Decodes the content of an image file to a numpy image array.
+
+    Args:
+        buf: uint8 numpy array with the content of the image.
+        max_dimension, grayscale, keep_alpha: Decode options, see \
+            get_imread_flags.
+
+    Returns:
+        image: Decoded numpy image array, None if it cannot be decoded.
+    """
+    dimensions = None
+    if max_dimension and not keep_alpha:
+        dimensions = get_image_dimensions_from_buffer(buf)
+    flags = get_imread_flags(max_dimension, grayscale, keep_alpha, dimensions)
+    return cv2.imdecode(buf, flags)
+
+
+def decode_image_object(image_object, **decode_options):
+    """
+    Decodes an uploaded image to a numpy image array.
+
+    Args:
+        image_object: Werkzeug FileStorage or a file like object.
+        decode_options: max_dimension, grayscale and keep_alpha, see \
+            get_imread_flags.
+
+    Returns:
+        image: Decoded numpy image array, None if it cannot be decoded.
+    """
+    return decode_image_buffer(get_image_buffer(image_object), **decode_options)
+
+
+def decode_image_file(file_path, **decode_options):
+    """
+    Decodes an image file to a numpy image array.
+
+    Args:
+        file_path: Path of the image.
+        decode_options: max_dimension, grayscale and keep_alpha, see \
+            get_imread_flags.
+
+    Returns:
+        image: Decoded numpy image array, None if it cannot be decoded.
+    """
+    try:
+        buf = np.fromfile(file_path, dtype=np.uint8)
+    except (IOError, OSError):
+        return None
+    return decode_image_buffer(buf, **decode_options)
+
+
+def get_image_as_numpy_arr(image_files_arr, **decode_options):
     """ Takes an array of image files and returns numpy array for the same
 
     This function is a helper function which takes in image files from users
@@ -80,23 +283,17 @@ def get_image_as_numpy_arr(image_files_arr):
 
     Args:
         image_files_arr: Array of image files from user request
+        decode_options: max_dimension, grayscale and keep_alpha, see \
+            get_imread_flags.
 
     Returns:
         image_np_arr: Array of numpy image array corresponding to given \
             image files.
     """
-    images_np_arr = []
-
-    for index, image_object in enumerate(image_files_arr):
-        in_memory = io.BytesIO()
-        image_object.save(in_memory)
-        data = np.fromstring(in_memory.getvalue(), dtype=np.uint8)
-        color_image_flag = 1
-        image = cv2.imdecode(data, color_image_flag)
-
-        images_np_arr.append(image)
-
-    return images_np_arr
+    return [
+        decode_image_object(image_object, **decode_options)
+        for image_object in image_files_arr
+    ]
 
 
 def check_if_string(data):
@@ -136,11 +333,60 @@ def strict_check_array_of_string(data):
             "send_text_array expects a list or tuple of string")
 
 
+# Per thread libmagic handle, see get_mime_type_from_buffer.
+_magic_local = threading.local()
+
+# Base64 signature for each of the supported image mime types.
+_MIME_TYPE_BASE64_SIGS = {
+    constants.MIME_TYPE_JPEG: constants.IMAGE_JPEG_BASE64_SIG,
+    constants.MIME_TYPE_JPG: constants.IMAGE_JPEG_BASE64_SIG,
+    constants.MIME_TYPE_PNG: constants.IMAGE_PNG_BASE64_SIG,
+    constants.MIME_TYPE_WEBP: constants.IMAGE_WEBP_BASE64_SIG,
+}
+
+
+def _get_magic():
+    """
+    Returns the libmagic handle for the current thread, it is created once
+    since creating it loads the whole magic database.
+    """
+    mime = getattr(_magic_local, "mime", None)
+    if mime is None:
+        mime = magic.Magic(mime=True)
+        _magic_local.mime = mime
+    return mime
+
+
+def get_mime_type_from_buffer(buf):
+    """
+    Detects the mime type of a file from its first bytes.
+
+    JPEG, PNG and WebP are recognized from their magic numbers without
+    calling libmagic, anything else is sniffed by a cached libmagic handle.
+
+    Args:
+        buf: bytes from the start of the file.
+
+    Returns:
+        mime_type: mime type of the content.
+    """
+    if buf[:3] == constants.JPEG_MAGIC_NUMBER:
+        return constants.MIME_TYPE_JPEG
+    elif buf[:8] == constants.PNG_MAGIC_NUMBER:
+        return constants.MIME_TYPE_PNG
+    elif buf[:4] == constants.RIFF_MAGIC_NUMBER and \
+            buf[8:12] == constants.WEBP_MAGIC_NUMBER:
+        return constants.MIME_TYPE_WEBP
+    return _get_magic().from_buffer(bytes(buf[:constants.MIME_SNIFF_SIZE]))
+
+
 def get_base64_image_from_file(file_path):
     """
     Takes image file_path as an argument and returns a base64 encoded string
     corresponding to the image.
 
+    The file is read once, its mime type is detected from the bytes read.
+
     Args:
         file_path: Image path
 
@@ -154,48 +400,74 @@ def get_base64_image_from_file(file_path):
     """
     try:
         with open(file_path, "rb") as file:
-            mime = magic.Magic(mime=True)
-            content_type = mime.from_file(file_path)
-            if content_type == constants.MIME_TYPE_JPEG or \
-                content_type == constants.MIME_TYPE_JPG:
-                src = constants.IMAGE_JPEG_BASE64_SIG
-            elif content_type == constants.MIME_TYPE_PNG:
-                src = constants.IMAGE_PNG_BASE64_SIG
-            else:
-                raise exceptions.InavalidMimeTypeException(
-                    "Not a valid mime type for image : {}".format(content_type))
-            src += str(base64.b64encode(file.read()))
-            return src
-
-    except FileNotFoundError:
+            content = file.read()
+    except (IOError, OSError):
         raise exceptions.InvalidFilePathException(
             "No file found matching the path {}".format(file_path))
 
-
-def get_base64_image_from_nparr(image_nparr):
+    content_type = get_mime_type_from_buffer(content)
+    try:
+        src = _MIME_TYPE_BASE64_SIGS[content_type]
+    except KeyError:
+        raise exceptions.InavalidMimeTypeException(
+            "Not a valid mime type for image : {}".format(content_type))
+    src += base64.b64encode(content).decode("ascii")
+    return src
+
+
+# Extension, base64 signature and quality parameter for each image format.
+_IMAGE_ENCODERS = {
+    constants.IMAGE_FORMAT_JPEG: (".jpg", constants.IMAGE_JPEG_BASE64_SIG,
+                                  cv2.IMWRITE_JPEG_QUALITY),
+    constants.IMAGE_FORMAT_PNG: (".png", constants.IMAGE_PNG_BASE64_SIG,
+                                 cv2.IMWRITE_PNG_COMPRESSION),
+    constants.IMAGE_FORMAT_WEBP: (".webp", constants.IMAGE_WEBP_BASE64_SIG,
+                                  cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def get_base64_image_from_nparr(
+        image_nparr,
+        image_format=constants.DEFAULT_IMAGE_ENCODING_FORMAT,
+        quality=constants.DEFAULT_IMAGE_ENCODING_QUALITY):
     """
     Takes a numpy image array as input and returns base64 encoded image string
 
+    The image is encoded in memory using cv2.imencode, nothing is written to
+    the disk.
+
     Args:
         image_nparr: Numpy array for the image.
+        image_format: Format to encode the image in, one of jpeg, png or webp.
+        quality: Quality(0-100) for jpeg and webp or compression level(0-9) \
+            for png, None to use the OpenCV default.
 
     Returns:
         image_src: base64 encoded image string
 
     Raises:
-        FileHandlingException: Error while handling file created to get base64 \
-            encoded string from np array using cv2
+        InavalidMimeTypeException: Not a supported image_format.
+        OutputHandlerException: Error while encoding the np array using cv2.
     """
     try:
-        path = os.path.join(constants.TMP_DIR_BASE_PATH, str(uuid.uuid4()))
-        cv2.imwrite(path, image_nparr)
-        img_src = get_base64_image_from_file(path)
-        os.remove(path)
-        return img_src
-
-    except OSError:
-        raise exceptions.FileHandlingException(
-            "Cannot write NP array to the path {} using cv2".format(path))
+        extension, img_src, quality_flag = _IMAGE_ENCODERS[image_format]
+    except KeyError:
+        raise exceptions.InavalidMimeTypeException(
+            "Not a valid format to encode image : {}".format(image_format))
+
+    params = [quality_flag, int(quality)] if quality is not None else []
+    try:
+        success, buf = cv2.imencode(extension, image_nparr, params)
+    except cv2.error as e:
+        raise exceptions.OutputHandlerException(
+            "Cannot encode NP array as {} using cv2 : {}".format(
+                image_format, e))
+    if not success:
+        raise exceptions.OutputHandlerException(
+            "Cannot encode NP array as {} using cv2".format(image_format))
+
+    img_src += base64.b64encode(buf.tobytes()).decode("ascii")
+    return img_src
 
 
 def validate_cache_path(cache_path):
@@ -0,0 +1,528 @@
+from collections import deque
+from concurrent import futures
+import threading
+import time
+from tornado.concurrent import Future
+
+from . import constants, exceptions
+
+
+class InjectQueue(object):
+    """ Bounded background queue for requests to the origami server
+    Payloads submitted to the queue are sent by a pool of worker threads so
+    that a slow origami server does not hold up the user handler. Each
+    submitted payload gets a future resolving to the response text.
+
+    When the queue is full the policy decides what happens to a new payload
+
+    * `block` -> wait until there is space in the queue.
+    * `drop_oldest` -> drop the oldest queued payload, its future fails \
+        with InjectQueueFullException.
+    * `raise` -> raise InjectQueueFullException.
+
+    .. code-block:: python
+
+        queue = InjectQueue(app.request_origami_server, maxsize=32)
+        future = queue.submit({"socketId": socketId, "data": ["Hello"]})
+        resp = future.result()
+
+    Attrs:
+        send_func: Callable sending a payload, its return value is the result \
+            of the future.
+        maxsize: Maximum number of payloads waiting in the queue.
+        workers: Number of threads draining the queue.
+        policy: Policy applied when the queue is full.
+    """
+
+    def __init__(self,
+                 send_func,
+                 maxsize=constants.INJECT_QUEUE_SIZE,
+                 workers=constants.INJECT_QUEUE_WORKERS,
+                 policy=constants.INJECT_QUEUE_POLICY_BLOCK):
+        if policy not in constants.INJECT_QUEUE_POLICIES:
+            raise exceptions.MismatchTypeException(
+                "Not a valid inject queue policy : {}".format(policy))
+        if maxsize < 1 or workers < 1:
+            raise exceptions.MismatchTypeException(
+                "Inject queue needs a positive maxsize and workers count")
+
+        self.send_func = send_func
+        self.maxsize = maxsize
+        self.workers = workers
+        self.policy = policy
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._stats = {
+            "submitted": 0,
+            "sent": 0,
+            "failed": 0,
+            "dropped": 0,
+            "max_depth": 0,
+            "total_latency": 0.0,
+            "last_latency": 0.0
+        }
+
+    def _start_workers(self):
+        """
+        Start the worker threads, must be called holding self._cond.
+        """
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._drain, name="origami-inject-queue")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload):
+        """
+        Queue a payload to be sent by the worker threads.
+
+        Args:
+            payload: Payload to be passed to send_func.
+
+        Returns:
+            future: concurrent.futures.Future resolving to the return value \
+                of send_func for the payload.
+
+        Raises:
+            InjectQueueFullException: The queue is full and the policy is \
+                `raise`, or the queue is closed.
+        """
+        future = futures.Future()
+        with self._cond:
+            if self._closed:
+                raise exceptions.InjectQueueFullException(
+                    "Inject queue is closed")
+            self._start_workers()
+
+            if len(self._queue) >= self.maxsize:
+                if self.policy == constants.INJECT_QUEUE_POLICY_RAISE:
+                    raise exceptions.InjectQueueFullException(
+                        "Inject queue is full ({} payloads)".format(
+                            self.maxsize))
+                elif self.policy == constants.INJECT_QUEUE_POLICY_DROP_OLDEST:
+                    _, dropped_future, _ = self._queue.popleft()
+                    self._stats["dropped"] += 1
+                    if dropped_future.set_running_or_notify_cancel():
+                        dropped_future.set_exception(
+                            exceptions.InjectQueueFullException(
+                                "Payload dropped from the full inject queue"))
+                else:
+                    while len(self._queue) >= self.maxsize and \
+                            not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        raise exceptions.InjectQueueFullException(
+                            "Inject queue is closed")
+
+            self._queue.append((payload, future, time.time()))
+            self._stats["submitted"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"],
+                                           len(self._queue))
+            self._cond.notify_all()
+
+        return future
+
+    def _drain(self):
+        """
+        Worker loop, sends queued payloads until the queue is closed.
+        """
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                payload, future, queued_at = self._queue.popleft()
+                self._cond.notify_all()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self.send_func(payload))
+                key = "sent"
+            except Exception as e:
+                future.set_exception(e)
+                key = "failed"
+
+            latency = time.time() - queued_at
+            with self._cond:
+                self._stats[key] += 1
+                self._stats["total_latency"] += latency
+                self._stats["last_latency"] = latency
+
+    def get_stats(self):
+        """
+        Statistics for the queue.
+
+        Returns:
+            stats (dict): A dict with the following keys
+
+                * `depth`: Payloads currently waiting in the queue.
+                * `max_depth`: Largest depth seen so far.
+                * `submitted`, `sent`, `failed`, `dropped`: Payload counts.
+                * `last_latency`: Seconds from submit to response for the \
+                    last drained payload.
+                * `avg_latency`: Average of the same over all drained payloads.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._queue)
+
+        drained = stats["sent"] + stats["failed"]
+        total_latency = stats.pop("total_latency")
+        stats["avg_latency"] = total_latency / drained if drained else 0.0
+        return stats
+
+    def close(self, wait=True):
+        """
+        Stop accepting payloads, the worker threads exit once the queued
+        payloads are sent.
+
+        Args:
+            wait (bool): Wait for the worker threads to exit.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class ImageCodecPool(object):
+    """ Thread pool for encoding and decoding images
+    OpenCV encode/decode and base64 release the GIL, so a batch of images
+    can be processed in parallel by a small pool of threads. Results are
+    returned in the order of the input and the time taken for each image
+    is recorded.
+
+    .. code-block:: python
+
+        pool = ImageCodecPool(max_workers=4)
+        image_srcs = pool.map(utils.get_base64_image_from_nparr, images)
+        print(pool.get_stats()["last_batch_times"])
+
+    Attrs:
+        max_workers: Number of threads in the pool, with 1 the images are \
+            processed in the calling thread.
+    """
+
+    def __init__(self, max_workers):
+        if max_workers < 1:
+            raise exceptions.MismatchTypeException(
+                "Image codec pool needs a positive max_workers")
+
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {"images": 0, "total_time": 0.0, "last_batch_times": []}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+        return self._executor
+
+    @staticmethod
+    def _timed_call(func, item):
+        start = time.time()
+        result = func(item)
+        return result, time.time() - start
+
+    def map(self, func, items):
+        """
+        Apply func to each of the items using the pool.
+
+        Args:
+            func (callable): Function encoding or decoding a single image.
+            items (list): Images to process.
+
+        Returns:
+            results (list): func(item) for each item, in the order of items.
+
+        Raises:
+            Any exception raised by func for the first failing item.
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            timed_results = [self._timed_call(func, item) for item in items]
+        else:
+            executor = self._get_executor()
+            timed_futures = [
+                executor.submit(self._timed_call, func, item) for item in items
+            ]
+            timed_results = [future.result() for future in timed_futures]
+
+        results = [result for result, _ in timed_results]
+        times = [elapsed for _, elapsed in timed_results]
+        with self._lock:
+            self._stats["images"] += len(times)
+            self._stats["total_time"] += sum(times)
+            self._stats["last_batch_times"] = times
+        return results
+
+    def get_stats(self):
+        """
+        Statistics for the pool.
+
+        Returns:
+            stats (dict): A dict with the following keys
+
+                * `workers`: Threads in the pool.
+                * `images`: Images processed so far.
+                * `total_time`: Seconds spent processing images, summed over \
+                    all the threads.
+                * `last_batch_times`: Seconds taken by each image of the last \
+                    batch, in the order of the batch.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["workers"] = self.max_workers
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Shut down the threads of the pool, a new executor is created if the
+        pool is used again.
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class FunctionExecutor(object):
+    """ Executor for the functions registered for persistent connections
+    Model functions can take seconds, running them on the IOLoop thread would
+    freeze every other websocket and request of the process. The handlers
+    submit them to this executor instead and write the result back when the
+    returned future completes.
+
+    With the process kind the function and its arguments are pickled to a
+    worker process, so they have to be defined at module level. The executor
+    is created on first use and can be reconfigured until then.
+
+    .. code-block:: python
+
+        executor = FunctionExecutor(kind="process", max_workers=2)
+        future = executor.submit(my_func, arg1, message="hello")
+
+    Attrs:
+        kind: thread or process.
+        max_workers: Number of threads or processes running the functions.
+    """
+
+    def __init__(self,
+                 kind=constants.FUNCTION_EXECUTOR_THREAD,
+                 max_workers=constants.FUNCTION_EXECUTOR_WORKERS):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+        self.configure(kind, max_workers)
+
+    def configure(self,
+                  kind=constants.FUNCTION_EXECUTOR_THREAD,
+                  max_workers=constants.FUNCTION_EXECUTOR_WORKERS):
+        """
+        Change the kind and number of workers, the current executor is shut
+        down once its running functions are done.
+
+        Raises:
+            MismatchTypeException: Not a valid kind or max_workers.
+        """
+        if kind not in constants.FUNCTION_EXECUTOR_KINDS:
+            raise exceptions.MismatchTypeException(
+                "Not a valid function executor kind : {}".format(kind))
+        if max_workers < 1:
+            raise exceptions.MismatchTypeException(
+                "Function executor needs a positive max_workers")
+
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+            self.kind = kind
+            self.max_workers = max_workers
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == constants.FUNCTION_EXECUTOR_PROCESS:
+                    self._executor = futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers)
+                else:
+                    self._executor = futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers)
+        return self._executor
+
+    def _on_done(self, future):
+        with self._lock:
+            if future.cancelled() or future.exception() is not None:
+                self._stats["failed"] += 1
+            else:
+                self._stats["completed"] += 1
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in the executor.
+
+        Returns:
+            future: concurrent.futures.Future resolving to the return value \
+                of func, a tornado coroutine can yield it.
+        """
+        executor = self._get_executor()
+        # Counted first, the function may be done before submit returns.
+        with self._lock:
+            self._stats["submitted"] += 1
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._stats["submitted"] -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): Functions `submitted`, `completed` and `failed`, \
+                `running` ones including those waiting for a worker, the \
+                `kind` and `workers` of the executor.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats["completed"] + stats["failed"]
+        stats["running"] = stats["submitted"] - finished
+        stats["kind"] = self.kind
+        stats["workers"] = self.max_workers
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Shut down the workers, a new executor is created if it is used again.
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class RequestLimiter(object):
+    """ Caps the requests handled at once by a tornado handler
+    Up to max_in_flight requests run at once and up to max_waiting more wait
+    for their turn in order, a request beyond that is rejected at once so the
+    handler can answer 503 with retry_after instead of letting the latency
+    of every request grow under a burst.
+
+    Only to be used from the IOLoop thread.
+
+    .. code-block:: python
+
+        limiter = RequestLimiter(max_in_flight=4, max_waiting=64)
+
+        @gen.coroutine
+        def get(self):
+            admitted = limiter.acquire()
+            if admitted is None:
+                self.set_status(503)
+                self.set_header("Retry-After", str(limiter.retry_after))
+                return
+            yield admitted
+            try:
+                yield run_model()
+            finally:
+                limiter.release()
+
+    Attrs:
+        max_in_flight: Requests running at once.
+        max_waiting: Requests waiting for one of the running ones to finish.
+        retry_after: Seconds a rejected client is told to wait.
+    """
+
+    def __init__(self,
+                 max_in_flight=constants.FASS_MAX_IN_FLIGHT,
+                 max_waiting=constants.FASS_MAX_WAITING,
+                 retry_after=constants.FASS_RETRY_AFTER):
+        self._waiters = deque()
+        self._in_flight = 0
+        self._stats = {"admitted": 0, "rejected": 0, "max_waiting_seen": 0}
+        self.configure(max_in_flight, max_waiting, retry_after)
+
+    def configure(self,
+                  max_in_flight=constants.FASS_MAX_IN_FLIGHT,
+                  max_waiting=constants.FASS_MAX_WAITING,
+                  retry_after=constants.FASS_RETRY_AFTER):
+        """
+        Change the limits, requests already admitted or waiting are kept.
+
+        Raises:
+            MismatchTypeException: max_in_flight is not positive or \
+                max_waiting is negative.
+        """
+        if max_in_flight < 1 or max_waiting < 0:
+            raise exceptions.MismatchTypeException(
+                "Request limiter needs a positive max_in_flight and a non "
+                "negative max_waiting")
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+
+    def acquire(self):
+        """
+        Ask for a turn, release must be called once the request is done if
+        a future is returned.
+
+        Returns:
+            future: tornado Future resolving once the request can run, None \
+                if the wait queue is full and the request is rejected.
+        """
+        future = Future()
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._stats["admitted"] += 1
+            future.set_result(None)
+        elif len(self._waiters) < self.max_waiting:
+            self._waiters.append(future)
+            self._stats["max_waiting_seen"] = max(
+                self._stats["max_waiting_seen"], len(self._waiters))
+        else:
+            self._stats["rejected"] += 1
+            return None
+        return future
+
+    def release(self):
+        """
+        A request admitted by acquire is done, the next waiting one runs.
+        """
+        self._in_flight -= 1
+        while self._waiters and self._in_flight < self.max_in_flight:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._in_flight += 1
+            self._stats["admitted"] += 1
+            waiter.set_result(None)
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict): Requests `in_flight` and `waiting` now, requests \
+                `admitted` and `rejected` so far and the longest wait queue \
+                seen as `max_waiting_seen`.
+        """
+        stats = dict(self._stats)
+        stats["in_flight"] = self._in_flight
+        stats["waiting"] = len(self._waiters)
+        return stats
@@ -33,6 +33,11 @@ setup(
   download_url='https://github.com/Cloud-CV/origami-lib',
 
   install_requires=install_requires,
+  entry_points={
+    'console_scripts': [
+      'origami-cache-gc=origami_lib.cache_manager:main',
+    ],
+  },
   classifiers=[
     'Development Status :: 1 - Alpha',
     'Programming Language :: Python',
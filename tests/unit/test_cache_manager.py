@@ -0,0 +1,58 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from origami_lib.cache_manager import OrigamiCacheManager, main, parse_size
+from origami_lib.pipeline import OrigamiCache
+
+
+class OrigamiCacheManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.unrelated_dir = os.path.join(self.tempdir, "a" * 32)
+        os.makedirs(self.unrelated_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def create_cache(self, content, last_access):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        cache_obj.save_image_file_array_to_cache([io.BytesIO(content)])
+        os.utime(
+            os.path.join(cache_obj.cache_dir, ".origami_cache"),
+            (last_access, last_access))
+        return cache_obj
+
+    def test_sweep_ttl(self):
+        now = time.time()
+        old = self.create_cache(b"x" * 1000, now - 100)
+        new = self.create_cache(b"y" * 1000, now)
+
+        report = OrigamiCacheManager(self.tempdir, ttl=50).sweep()
+
+        assert report["removed_caches"] == 1
+        assert 1000 <= report["reclaimed_bytes"] < 1100
+        assert not os.path.exists(old.cache_dir)
+        assert os.path.exists(new.cache_dir)
+        assert os.path.exists(self.unrelated_dir)
+
+    def test_sweep_max_size(self):
+        now = time.time()
+        caches = [
+            self.create_cache(str(i).encode() * 1000, now - 10 * i)
+            for i in range(4)
+        ]
+
+        report = main(["--cache-path", self.tempdir, "--max-size", "2K"])
+
+        assert report["removed_caches"] == 3
+        assert 3000 <= report["reclaimed_bytes"] < 3300
+        assert os.path.exists(caches[0].cache_dir)
+
+    def test_parse_size(self):
+        assert parse_size("512") == 512
+        assert parse_size("2k") == 2048
+        assert parse_size("1.5G") == int(1.5 * 1024**3)
@@ -1,8 +1,312 @@
-from tornado.testing import AsyncHTTPTestCase
-from tornado.web import Application
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
 
-from origami_lib.origami import FunctionServiceHandler
-from origami_lib.exceptions import MismatchTypeException
+import cv2
+import numpy as np
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+from tornado.websocket import websocket_connect
+
+from origami_lib import constants
+from origami_lib.backends import SharedMemoryCacheBackend
+from origami_lib.origami import (FunctionServiceHandler, Origami,
+                                 OrigamiWebSocketHandler)
+from origami_lib.exceptions import (InvalidCacheConfigException,
+                                    MismatchTypeException,
+                                    OrigamiRequesterException,
+                                    OutputHandlerException)
+
+
+class InjectHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    received = []
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self.received.append(json.loads(body.decode("utf-8")))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class OrigamiRequesterTest(unittest.TestCase):
+    def setUp(self):
+        self.inject_server = HTTPServer(("127.0.0.1", 0), InjectHandler)
+        thread = threading.Thread(target=self.inject_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.app = Origami(
+            "test",
+            server_base="127.0.0.1:{}".format(
+                self.inject_server.server_address[1]),
+            requester_pool_size=2)
+
+        InjectHandler.received = []
+
+    def tearDown(self):
+        self.app.close_requester_session()
+        self.inject_server.shutdown()
+        self.inject_server.server_close()
+
+    def test_request_origami_server_reuses_connection(self):
+        for i in range(3):
+            resp = self.app.request_origami_server({"socketId": str(i)})
+            self.assertIn(str(i), resp)
+
+        stats = self.app.get_requester_stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["pool_size"], 2)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(self.app._requester_target_url,
+                         self.app._get_origami_server_target_url())
+
+    def test_request_async_without_io_loop(self):
+        errors = []
+
+        def request():
+            try:
+                self.app.request_origami_server_async({"socketId": "0"})
+            except OrigamiRequesterException as e:
+                errors.append(e)
+
+        # A worker thread has no running IOLoop before run().
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1)
+
+    def test_coalesce_outputs(self):
+        self.app.coalesce_outputs = True
+
+        @self.app.listen()
+        @self.app.origami_api
+        def handler():
+            self.app.send_text_array(["Hello"])
+            self.app.send_text_array_to_terminal(["World"])
+            self.app.send_graph_array([[1, 2]])
+
+        client = self.app.server.test_client()
+        client.post("/event", data={"socket-id": "sid"})
+
+        self.assertEqual(InjectHandler.received, [{
+            "socketId": "sid",
+            "multipart": [{"data": ["Hello"]}, {"terminalData": ["World"]},
+                          {"data": [[1, 2]]}]
+        }])
+
+
+class OrigamiSharedSettingsTest(unittest.TestCase):
+    def test_persistent_conn_ttl_kept(self):
+        registry = OrigamiWebSocketHandler.persistent_conn_map
+        self.addCleanup(setattr, registry, "ttl", registry.ttl)
+        Origami("first", persistent_conn_ttl=60)
+        # An app created without it does not reset the shared registry.
+        Origami("second")
+        self.assertEqual(registry.ttl, 60)
+
+    def test_function_executor_kept(self):
+        executor = OrigamiWebSocketHandler.function_executor
+        self.addCleanup(executor.configure, executor.kind,
+                        executor.max_workers)
+        Origami("first", function_executor_kind="process",
+                function_executor_workers=2)
+        Origami("second")
+        self.assertEqual((executor.kind, executor.max_workers),
+                         ("process", 2))
+        Origami("third", function_executor_workers=3)
+        self.assertEqual((executor.kind, executor.max_workers),
+                         ("process", 3))
+
+    def test_fass_limits_kept(self):
+        limiter = FunctionServiceHandler.fass_limiter
+        self.addCleanup(limiter.configure, limiter.max_in_flight,
+                        limiter.max_waiting, limiter.retry_after)
+        Origami("first", fass_max_in_flight=8, fass_retry_after=5)
+        Origami("second", fass_max_waiting=10)
+        self.assertEqual(
+            (limiter.max_in_flight, limiter.max_waiting, limiter.retry_after),
+            (8, 10, 5))
+
+    def test_fass_registry_kept(self):
+        registry = FunctionServiceHandler.functional_service_map
+        self.addCleanup(setattr, registry, "capacity", registry.capacity)
+        self.addCleanup(setattr, registry, "ttl", registry.ttl)
+        Origami("first", fass_capacity=4096, fass_ttl=60)
+        Origami("second")
+        self.assertEqual((registry.capacity, registry.ttl), (4096, 60))
+
+    def test_args_store_kept(self):
+        registries = (OrigamiWebSocketHandler.persistent_conn_map,
+                      FunctionServiceHandler.functional_service_map)
+        for registry in registries:
+            self.addCleanup(setattr, registry, "args_store",
+                            registry.args_store)
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir, ignore_errors=True)
+        first = Origami("first", args_memory_budget=1 << 20,
+                        args_spill_path=tempdir)
+        second = Origami("second")
+        third = Origami("third", args_memory_budget=1 << 21)
+        for registry in registries:
+            self.assertIs(registry.args_store, first.args_store)
+        self.assertIs(second.args_store, first.args_store)
+        self.assertIs(third.args_store, first.args_store)
+        self.assertEqual(first.args_store.max_bytes, 1 << 21)
+
+
+class OrigamiInputsTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.app = Origami(
+            "test", cache_path=self.tempdir, image_decoder_pool_size=2)
+        self.images = [
+            np.full((4 + i, 6, 3), i * 40, dtype=np.uint8) for i in range(4)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def image_request_context(self):
+        data = {}
+        for i, image in enumerate(self.images):
+            content = cv2.imencode(".png", image)[1].tobytes()
+            data["input-image-{}".format(i)] = (io.BytesIO(content),
+                                                "{}.png".format(i))
+        return self.app.server.test_request_context(
+            "/event", method="POST", data=data)
+
+    def test_get_image_array_numpy_mode(self):
+        with self.image_request_context():
+            decoded = self.app.get_image_array(
+                mode=constants.INPUT_IMAGE_ARRAY_NPARRAY_MODE)
+
+        self.assertEqual(len(decoded), len(self.images))
+        for image, decoded_image in zip(self.images, decoded):
+            self.assertTrue(np.array_equal(image, decoded_image))
+        self.assertEqual(self.app.get_image_decoder_stats()["images"], 4)
+
+    def test_get_image_array_lazy_mode(self):
+        with self.image_request_context():
+            handles = self.app.get_image_array(
+                mode=constants.INPUT_IMAGE_ARRAY_LAZY_MODE)
+
+            self.assertEqual(handles[1].get_dimensions(), (6, 5))
+            self.assertTrue(
+                np.array_equal(handles[1].get_nparr(), self.images[1]))
+            self.assertEqual(os.listdir(self.tempdir), [])
+
+            path = handles[2].get_file_path()
+            self.assertTrue(path.startswith(self.tempdir))
+            self.assertTrue(
+                np.array_equal(cv2.imread(path), self.images[2]))
+
+    def test_cache_manager_follows_backend(self):
+        shm_path = os.path.join(self.tempdir, "shm")
+        app = Origami("test", cache_path=self.tempdir,
+                      cache_backend=SharedMemoryCacheBackend(shm_path),
+                      cache_max_size=1024)
+        self.assertEqual(app.cache_manager.cache_path, shm_path)
+
+        self.assertRaises(InvalidCacheConfigException, Origami, "test",
+                          cache_path=self.tempdir,
+                          cache_backend=constants.CACHE_BACKEND_SQLITE,
+                          cache_ttl=60)
+
+
+class EchoInjectHandler(RequestHandler):
+    def post(self):
+        self.write(self.request.body)
+
+
+class OrigamiAsyncRequesterTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/inject', EchoInjectHandler)])
+
+    @gen_test
+    def test_send_text_array_async(self):
+        app = Origami(
+            "test", server_base="127.0.0.1:{}".format(self.get_http_port()))
+        resp = yield app.send_text_array_async(["Hello"], socketId="sid")
+        self.assertEqual(
+            json.loads(resp), {"socketId": "sid", "data": ["Hello"]})
+
+        with self.assertRaises(OutputHandlerException):
+            yield app.send_text_array_async(["Hello"])
+
+        # Asynchronous requests are counted without a pooled session.
+        self.assertIsNone(app._requester_session)
+        self.assertEqual(app.get_requester_stats()["requests"], 1)
+
+
+class OrigamiWebSocketHandlerTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return Application([(r'/websocket', OrigamiWebSocketHandler)])
+
+    @gen.coroutine
+    def connect(self, socket_id, func):
+        OrigamiWebSocketHandler.persistent_conn_map.register(
+            socket_id, func, [socket_id])
+        self.addCleanup(OrigamiWebSocketHandler.persistent_conn_map.remove,
+                        socket_id)
+        conn = yield websocket_connect(
+            "ws://127.0.0.1:{}/websocket".format(self.get_http_port()))
+        raise gen.Return(conn)
+
+    @gen_test(timeout=10)
+    def test_functions_run_off_the_io_loop(self):
+        release = threading.Event()
+
+        def slow_func(socket_id, message=""):
+            release.wait(5)
+            return "{}:{}".format(socket_id, message)
+
+        def fast_func(socket_id, message=""):
+            return "{}:{}".format(socket_id, message)
+
+        slow_conn = yield self.connect("slow", slow_func)
+        fast_conn = yield self.connect("fast", fast_func)
+        for i in range(3):
+            slow_conn.write_message(
+                json.dumps({constants.REQUEST_SOCKET_ID_KEY: "slow",
+                            "data": str(i)}))
+
+        # Answered while the slow socket is still busy.
+        release_later = threading.Timer(1, release.set)
+        release_later.start()
+        self.addCleanup(release_later.cancel)
+        fast_conn.write_message(
+            json.dumps({constants.REQUEST_SOCKET_ID_KEY: "fast",
+                        "data": "hi"}))
+        response = yield fast_conn.read_message()
+        self.assertFalse(release.is_set())
+        release.set()
+        self.assertEqual(response, "fast:hi")
+
+        responses = []
+        for _ in range(3):
+            response = yield slow_conn.read_message()
+            responses.append(response)
+        self.assertEqual(responses, ["slow:0", "slow:1", "slow:2"])
+        slow_conn.close()
+        fast_conn.close()
 
 
 class FunctionServiceHandlerTest(AsyncHTTPTestCase):
@@ -23,7 +327,7 @@ class FunctionServiceHandlerTest(AsyncHTTPTestCase):
                           "pass a callable here", ["a"])
 
         f_id = x.register_persistent_http_connection(temp_func, ["argument"])
-        entry = x.functional_service_map[-1]
+        entry = x.functional_service_map.get(f_id)
         self.assertEqual(f_id, entry["id"])
         self.assertEqual(["argument"], entry["arguments"])
 
@@ -37,3 +341,32 @@ class FunctionServiceHandlerTest(AsyncHTTPTestCase):
         res = self.fetch("/fass?query=test&id={}".format(f_id))
         self.assertEqual(res.code, 200)
         self.assertEqual(res.body, temp_func("argument", "test").encode())
+
+    @gen_test(timeout=10)
+    def test_fass_concurrency_limit(self):
+        release = threading.Event()
+
+        def slow_func(arg, query=""):
+            release.wait(5)
+            return arg + '::' + query
+
+        limiter = FunctionServiceHandler.fass_limiter
+        limiter.configure(max_in_flight=1, max_waiting=1, retry_after=3)
+        self.addCleanup(limiter.configure)
+        f_id = FunctionServiceHandler.register_persistent_http_connection(
+            slow_func, ["argument"])
+        url = self.get_url("/fass?query=test&id={}".format(f_id))
+
+        running = self.http_client.fetch(url, raise_error=False)
+        waiting = self.http_client.fetch(url, raise_error=False)
+        while limiter.get_stats()["waiting"] < 1:
+            yield gen.sleep(0.01)
+
+        rejected = yield self.http_client.fetch(url, raise_error=False)
+        self.assertEqual(rejected.code, 503)
+        self.assertEqual(rejected.headers["Retry-After"], "3")
+
+        release.set()
+        responses = yield [running, waiting]
+        self.assertEqual([res.code for res in responses], [200, 200])
+        self.assertEqual(limiter.get_stats()["in_flight"], 0)
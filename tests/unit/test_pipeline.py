@@ -1,8 +1,22 @@
+import hashlib
+import io
 import unittest
 import tempfile
 import os
+import shutil
+import stat
+import threading
 
-from origami_lib.pipeline import OrigamiCache
+import cv2
+import numpy as np
+
+from origami_lib import constants
+from origami_lib.backends import (OrigamiCacheBackend,
+                                  SharedMemoryCacheBackend,
+                                  SQLiteCacheBackend, create_cache_backend)
+from origami_lib.exceptions import (InvalidCacheConfigException,
+                                    MalformedCacheException)
+from origami_lib.pipeline import OrigamiCache, OrigamiMemoryCache
 
 
 class OrigamiCacheTest(unittest.TestCase):
@@ -37,3 +51,271 @@ class OrigamiCacheTest(unittest.TestCase):
 
         assert new_cache_id == cache_obj.cache_id
         assert cache_id != new_cache_id
+
+    def test_save_image_file_array_to_cache(self):
+        cache_obj = OrigamiCache(
+            cache_path=self.tempdir, hash_algorithm="blake2b")
+        content = b"not really an image" * 10000
+        image_objects = [io.BytesIO(content), io.BytesIO(b"other"),
+                         io.BytesIO(content)]
+
+        blobs_hash = cache_obj.save_image_file_array_to_cache(image_objects)
+
+        assert blobs_hash[0] == hashlib.blake2b(content).hexdigest()
+        assert blobs_hash[0] == blobs_hash[2]
+        blobs_dir = os.path.join(cache_obj.cache_dir,
+                                 constants.IMAGE_BLOBS_DIR)
+        assert sorted(os.listdir(blobs_dir)) == sorted(set(blobs_hash))
+        with open(os.path.join(blobs_dir, blobs_hash[0]), "rb") as blob:
+            assert blob.read() == content
+
+        self.assertRaises(InvalidCacheConfigException, OrigamiCache,
+                          self.tempdir, "not-a-hash")
+
+    def test_shared_blob_store(self):
+        content = b"popular sample image"
+        caches = [OrigamiCache(cache_path=self.tempdir) for _ in range(3)]
+        for cache_obj in caches:
+            blob_hash = cache_obj.save_image_file_array_to_cache(
+                [io.BytesIO(content)])[0]
+
+        store_blob_path = caches[0].backend._get_store_blob_path(blob_hash)
+        assert os.path.exists(store_blob_path)
+        assert caches[0].get_blob_refcount(blob_hash) == 3
+        assert os.path.samefile(
+            caches[1].load_image_file_paths_from_cache()[0], store_blob_path)
+        # The file is shared between the caches, so it is read only.
+        assert stat.S_IMODE(os.stat(store_blob_path).st_mode) == \
+            constants.BLOB_FILE_MODE
+
+        for refcount, cache_obj in zip([2, 1, 0], caches):
+            cache_obj.delete_current_cache()
+            assert caches[0].get_blob_refcount(blob_hash) == refcount
+        assert not os.path.exists(store_blob_path)
+
+    def test_text_array_cache(self):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        text_array = ["Hello, ", 'say "hi"', "back\\slash", "new\nline", ""]
+
+        cache_obj.save_text_array_to_cache(text_array)
+
+        assert cache_obj.load_text_array_from_cache() == text_array
+
+    def test_load_legacy_text_cache(self):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        text_cache_path = os.path.join(cache_obj.cache_dir,
+                                       constants.TEXT_CACHE_FILE)
+        with open(text_cache_path, "w") as text_cache:
+            text_cache.write('["Hello, ", "World!"]')
+
+        assert cache_obj.load_text_array_from_cache() == ["Hello, ", "World!"]
+
+        with open(text_cache_path, "w") as text_cache:
+            text_cache.write('["Hello, ", ')
+        self.assertRaises(MalformedCacheException,
+                          cache_obj.load_text_array_from_cache)
+
+    def test_load_image_nparr_from_cache_mmap(self):
+        image = np.arange(60, dtype=np.uint8).reshape((4, 5, 3))
+        content = cv2.imencode(".png", image)[1].tobytes()
+        cache_obj = OrigamiCache(
+            cache_path=self.tempdir, cache_decoded_arrays=True)
+        cache_obj.save_image_file_array_to_cache([io.BytesIO(content)])
+
+        for _ in range(2):
+            loaded = cache_obj.load_image_nparr_from_cache()[0]
+            assert isinstance(loaded, np.memmap)
+            assert np.array_equal(loaded, image)
+
+        gray = cache_obj.load_image_nparr_from_cache(grayscale=True)[0]
+        assert gray.shape == (4, 5)
+        blobs_dir = os.path.join(cache_obj.cache_dir,
+                                 constants.IMAGE_BLOBS_DIR)
+        assert len(os.listdir(blobs_dir)) == 3
+
+    def test_memory_cache(self):
+        memory_cache = OrigamiMemoryCache(max_bytes=1024**2)
+        cache_obj = OrigamiCache(
+            cache_path=self.tempdir, memory_cache=memory_cache)
+        cache_obj.save_text_array_to_cache(["Hello, ", "World!"])
+        os.remove(
+            os.path.join(cache_obj.cache_dir, constants.TEXT_CACHE_FILE))
+
+        text_array = cache_obj.load_text_array_from_cache()
+        assert text_array == ["Hello, ", "World!"]
+        text_array.append("mutated")
+        assert cache_obj.load_text_array_from_cache() == ["Hello, ", "World!"]
+
+        image = np.arange(60, dtype=np.uint8).reshape((4, 5, 3))
+        content = cv2.imencode(".png", image)[1].tobytes()
+        cache_obj.save_image_file_array_to_cache([io.BytesIO(content)])
+        first = cache_obj.load_image_nparr_from_cache()[0]
+        # The arrays returned are copies the caller can change.
+        first -= 1
+        second = cache_obj.load_image_nparr_from_cache()[0]
+        assert second is not first and np.array_equal(second, image)
+        stats = memory_cache.get_stats()
+        assert stats["hits"] == 5 and stats["misses"] == 2
+
+        # The raw blob is served from memory for the other decode options.
+        os.remove(cache_obj.load_image_file_paths_from_cache()[0])
+        gray = cache_obj.load_image_nparr_from_cache(grayscale=True)[0]
+        assert gray.shape == (4, 5)
+
+        cache_obj.delete_current_cache()
+        assert memory_cache.get_stats()["entries"] == 0
+
+    def test_memory_cache_eviction(self):
+        memory_cache = OrigamiMemoryCache(max_bytes=250)
+        for i in range(3):
+            memory_cache.put(("cache", i), np.zeros(100, dtype=np.uint8))
+        memory_cache.put(("cache", "large"), np.zeros(300, dtype=np.uint8))
+
+        assert memory_cache.get(("cache", 0)) is None
+        assert memory_cache.get(("cache", 2)) is not None
+        assert memory_cache.get(("cache", "large")) is None
+        stats = memory_cache.get_stats()
+        assert stats["evictions"] == 1 and stats["bytes"] == 200
+
+    def test_iter_image_nparr_from_cache(self):
+        images = [
+            np.full((4, 5, 3), i, dtype=np.uint8) for i in range(0, 250, 25)
+        ]
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        cache_obj.save_image_file_array_to_cache([
+            io.BytesIO(cv2.imencode(".png", image)[1].tobytes())
+            for image in images
+        ])
+
+        for prefetch in (0, 1, 3, 20):
+            loaded = list(
+                cache_obj.iter_image_nparr_from_cache(prefetch=prefetch))
+            assert len(loaded) == len(images)
+            for image, loaded_image in zip(images, loaded):
+                assert np.array_equal(image, loaded_image)
+
+        iterator = cache_obj.iter_image_nparr_from_cache(
+            prefetch=2, grayscale=True)
+        assert next(iterator).shape == (4, 5)
+        iterator.close()
+
+    def test_append_to_cache(self):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        cache_obj.save_text_array_to_cache(["a"])
+
+        def append(i):
+            for j in range(50):
+                cache_obj.append_text_array_to_cache(["{}-{}".format(i, j)])
+
+        threads = [threading.Thread(target=append, args=(i, ))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        text_array = cache_obj.load_text_array_from_cache()
+        assert len(text_array) == 201 and text_array[0] == "a"
+        assert sorted(text_array[1:]) == sorted(
+            "{}-{}".format(i, j) for i in range(4) for j in range(50))
+
+        image = np.zeros((2, 2, 3), dtype=np.uint8)
+        content = cv2.imencode(".png", image)[1].tobytes()
+        cache_obj.save_image_file_array_to_cache([io.BytesIO(content)])
+        cache_obj.append_image_file_array_to_cache([io.BytesIO(content)])
+        assert len(cache_obj.load_image_file_paths_from_cache()) == 2
+
+    def test_append_after_interrupted_append(self):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        cache_obj.append_text_array_to_cache(["Hello, "])
+        text_cache_path = os.path.join(cache_obj.cache_dir,
+                                       constants.TEXT_CACHE_FILE)
+        with open(text_cache_path, "a") as text_cache:
+            text_cache.write('"interrup')
+
+        # The incomplete line is ignored when reading and dropped instead of
+        # glued to the new one when appending.
+        assert cache_obj.load_text_array_from_cache() == ["Hello, "]
+        cache_obj.append_text_array_to_cache(["World!"])
+        assert cache_obj.load_text_array_from_cache() == ["Hello, ", "World!"]
+
+        # Same for a manifest truncated in the middle of its last entry.
+        with open(text_cache_path, "r+") as text_cache:
+            text_cache.truncate(os.path.getsize(text_cache_path) - 4)
+        assert cache_obj.load_text_array_from_cache() == ["Hello, "]
+
+    def test_compact_cache(self):
+        cache_obj = OrigamiCache(cache_path=self.tempdir)
+        cache_obj.append_text_array_to_cache(["Hello, ", "World!"])
+        text_cache_path = os.path.join(cache_obj.cache_dir,
+                                       constants.TEXT_CACHE_FILE)
+        with open(text_cache_path, "a") as text_cache:
+            text_cache.write('"interrup')
+
+        cache_obj.compact_cache()
+        assert cache_obj.load_text_array_from_cache() == ["Hello, ", "World!"]
+
+        with open(text_cache_path, "w") as text_cache:
+            text_cache.write('["Hello, ", "World!"]')
+        cache_obj.compact_cache()
+        with open(text_cache_path) as text_cache:
+            assert text_cache.readline().rstrip("\n") == \
+                constants.CACHE_FILE_HEADER
+        assert cache_obj.load_text_array_from_cache() == ["Hello, ", "World!"]
+
+    def test_cache_backends(self):
+        content = cv2.imencode(".png", np.zeros((4, 5, 3),
+                                                dtype=np.uint8))[1].tobytes()
+        backends = [SQLiteCacheBackend(self.tempdir)]
+        if os.path.isdir("/dev/shm"):
+            backends.append(
+                SharedMemoryCacheBackend(os.path.join(
+                    "/dev/shm", os.path.basename(self.tempdir))))
+
+        for backend in backends:
+            cache_obj = OrigamiCache(backend=backend)
+            cache_obj.save_text_array_to_cache([])
+            assert cache_obj.load_text_array_from_cache() == []
+            cache_obj.append_text_array_to_cache(["Hello, ", "World!"])
+            assert cache_obj.load_text_array_from_cache() == \
+                ["Hello, ", "World!"]
+
+            blobs_hash = cache_obj.save_image_file_array_to_cache(
+                [io.BytesIO(content), io.BytesIO(content)])
+            assert cache_obj.get_blob_refcount(blobs_hash[0]) == 1
+            assert cache_obj.load_image_nparr_from_cache()[1].shape == \
+                (4, 5, 3)
+            with open(cache_obj.load_image_file_paths_from_cache()[0],
+                      "rb") as blob:
+                assert blob.read() == content
+
+            cache_obj.delete_current_cache()
+            assert cache_obj.get_blob_refcount(blobs_hash[0]) == 0
+            backend.close()
+            if isinstance(backend, SharedMemoryCacheBackend):
+                shutil.rmtree(backend.cache_path)
+
+        self.assertRaises(InvalidCacheConfigException, create_cache_backend,
+                          "not-a-backend", self.tempdir)
+
+        class IncompleteBackend(OrigamiCacheBackend):
+            def create_cache(self, cache_id):
+                pass
+
+        self.assertRaises(TypeError, IncompleteBackend, self.tempdir)
+
+    def test_sqlite_shared_blob(self):
+        backend = SQLiteCacheBackend(self.tempdir)
+        self.addCleanup(backend.close)
+        content = os.urandom(3 * constants.BLOB_CHUNK_SIZE + 7)
+        for cache_id in ("first", "second"):
+            backend.create_cache(cache_id)
+            blob_hash = backend.save_blob(cache_id, io.BytesIO(content))
+        assert backend.get_blob_refcount(blob_hash) == 2
+
+        # The blob is only dropped with the last cache referencing it.
+        backend.delete_cache("first")
+        assert backend.read_blob("second", blob_hash).tobytes() == content
+        backend.delete_cache("second")
+        assert backend._get_connection().execute(
+            "SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
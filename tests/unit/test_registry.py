@@ -0,0 +1,155 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from origami_lib.registry import ArgumentStore, ConnectionRegistry
+
+
+class ConnectionRegistryTest(unittest.TestCase):
+    def test_register(self):
+        registry = ConnectionRegistry()
+        first = registry.register("socket", len, [1])
+        second = registry.register("socket", len, [2])
+
+        self.assertEqual(len(registry), 1)
+        self.assertIs(registry.get("socket"), second)
+        self.assertIsNone(registry.get("missing"))
+
+        # The connection replaced does not remove the new one.
+        self.assertFalse(registry.remove("socket", first))
+        self.assertTrue(registry.remove("socket", second))
+        self.assertNotIn("socket", registry)
+
+    def test_sweep(self):
+        registry = ConnectionRegistry(ttl=10)
+        for conn_id in range(3):
+            registry.register(conn_id, len, [])
+        now = registry.get(0)["timestamp"] + 5
+        registry._last_access[0] = now
+
+        self.assertEqual(registry.sweep(now + 6), 2)
+        self.assertEqual(list(registry._entries), [0])
+        self.assertEqual(registry.get_stats()["expired"], 2)
+        self.assertEqual(ConnectionRegistry().sweep(), 0)
+
+    def test_capacity(self):
+        registry = ConnectionRegistry(capacity=2)
+        for conn_id in range(2):
+            registry.register(conn_id, len, [])
+        # The least recently used is evicted, not the oldest registered.
+        registry.get(0)
+        registry.register(2, len, [])
+
+        self.assertEqual(sorted(registry._entries), [0, 2])
+        self.assertEqual(registry.get_stats()["evicted"], 1)
+
+
+class ArgumentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.spill_path = tempfile.mkdtemp()
+        self.args_store = ArgumentStore(
+            3 * 1024 * 1024, spill_path=self.spill_path)
+        self.registry = ConnectionRegistry(args_store=self.args_store)
+
+    def tearDown(self):
+        self.args_store.close()
+        shutil.rmtree(self.spill_path)
+
+    def register(self, conn_id):
+        features = np.full((1024, 1024), conn_id, dtype=np.uint8)
+        return self.registry.register(conn_id, np.sum,
+                                      [features, {"bias": features.copy()}])
+
+    def test_spill(self):
+        conns = [self.register(conn_id) for conn_id in range(3)]
+        # Each connection holds 2MiB, only the last one fits the budget.
+        self.assertIsInstance(conns[0]["arguments"][0], np.memmap)
+        self.assertIsInstance(conns[1]["arguments"][1]["bias"], np.memmap)
+        self.assertNotIsInstance(conns[2]["arguments"][0], np.memmap)
+        stats = self.args_store.get_stats()
+        self.assertEqual(stats["spills"], 4)
+        self.assertEqual(stats["entries"], 3)
+        self.assertLessEqual(stats["bytes"], stats["max_bytes"])
+
+        # Spilled arguments are reloaded transparently.
+        conn = self.registry.get(1)
+        self.assertEqual(conn["func"](conn["arguments"][0]), 1024 * 1024)
+        # Writes to a spilled argument do not reach its spill file.
+        conn["arguments"][0][0, 0] = 5
+        spill_file = conn["arguments"][0].filename
+        self.assertEqual(np.load(spill_file)[0, 0], 1)
+
+    def test_spill_shared(self):
+        features = np.zeros((1024, 1024), dtype=np.uint8)
+        state = {"calls": 0}
+        args = [features, {"feat": features}, (features, 1), state]
+        conn = self.registry.register(0, np.sum, args)
+        self.assertEqual(self.args_store.get_stats()["bytes"],
+                         ArgumentStore.get_size(args))
+        self.register(1)
+        self.register(2)
+
+        # An array referenced twice is spilled to a single memory map, the
+        # objects of the caller are not changed and the containers holding
+        # no spilled array are kept as is.
+        spilled = conn["arguments"]
+        self.assertIsInstance(spilled[0], np.memmap)
+        self.assertIs(spilled[1]["feat"], spilled[0])
+        self.assertIs(spilled[2][0], spilled[0])
+        self.assertIs(spilled[3], state)
+        self.assertIs(args[0], features)
+        self.assertIs(args[1]["feat"], features)
+        self.assertEqual(self.args_store.get_stats()["spills"], 3)
+
+    def test_spill_shared_between_connections(self):
+        features = np.zeros((1024, 1024), dtype=np.uint8)
+        conns = [
+            self.registry.register(conn_id, np.sum, [features])
+            for conn_id in range(20)
+        ]
+        stats = self.args_store.get_stats()
+        self.assertEqual(stats["arrays"], 1)
+        self.assertLess(stats["bytes"], 2 * 1024 * 1024)
+        self.assertEqual(stats["spills"], 0)
+
+        # Over budget the array is spilled once, for all its holders.
+        self.register(20)
+        self.register(21)
+        self.assertEqual(self.args_store.get_stats()["spills"], 3)
+        spilled = conns[0]["arguments"][0]
+        self.assertIsInstance(spilled, np.memmap)
+        for conn in conns:
+            self.assertIs(conn["arguments"][0], spilled)
+        # A new holder of a spilled array gets its memory map.
+        conn = self.registry.register(22, np.sum, [features])
+        self.assertIs(conn["arguments"][0], spilled)
+
+        spill_dir = self.args_store._spill_dir
+        self.assertEqual(len(os.listdir(spill_dir)), 3)
+        for conn_id in range(22):
+            self.registry.remove(conn_id)
+        # The spill file is kept while a connection holds the array.
+        self.assertEqual(len(os.listdir(spill_dir)), 1)
+        self.registry.remove(22)
+        self.assertEqual(os.listdir(spill_dir), [])
+        self.assertEqual(self.args_store.get_stats()["bytes"], 0)
+
+    def test_remove(self):
+        for conn_id in range(3):
+            self.register(conn_id)
+        spill_dir = self.args_store._spill_dir
+        self.assertEqual(len(os.listdir(spill_dir)), 4)
+
+        self.registry.remove(0)
+        self.assertEqual(len(os.listdir(spill_dir)), 2)
+        self.assertEqual(self.args_store.get_stats()["entries"], 2)
+
+        # The spilled arguments of a replaced connection are removed too.
+        self.register(1)
+        self.assertEqual(self.args_store.get_stats()["entries"], 2)
+        self.registry.remove(1)
+        self.registry.remove(2)
+        self.assertEqual(os.listdir(spill_dir), [])
+        self.assertEqual(self.args_store.get_stats()["bytes"], 0)
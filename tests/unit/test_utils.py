@@ -0,0 +1,95 @@
+import base64
+import io
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from origami_lib import constants, utils
+from origami_lib.exceptions import (InavalidMimeTypeException,
+                                    InvalidFilePathException)
+
+
+class UtilsTest(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((8, 12, 3), dtype=np.uint8)
+        self.image[:, :6] = 255
+
+    def decode(self, img_src, sig):
+        assert img_src.startswith(sig)
+        buf = base64.b64decode(img_src[len(sig):])
+        return cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+
+    def test_get_base64_image_from_nparr(self):
+        img_src = utils.get_base64_image_from_nparr(self.image)
+        decoded = self.decode(img_src, constants.IMAGE_JPEG_BASE64_SIG)
+        self.assertEqual(decoded.shape, self.image.shape)
+
+        img_src = utils.get_base64_image_from_nparr(
+            self.image, constants.IMAGE_FORMAT_PNG, 9)
+        decoded = self.decode(img_src, constants.IMAGE_PNG_BASE64_SIG)
+        self.assertTrue(np.array_equal(decoded, self.image))
+
+        self.assertRaises(InavalidMimeTypeException,
+                          utils.get_base64_image_from_nparr, self.image, "bmp")
+
+    def test_get_mime_type_from_buffer(self):
+        _, png = cv2.imencode(".png", self.image)
+        _, jpeg = cv2.imencode(".jpg", self.image)
+
+        self.assertEqual(
+            utils.get_mime_type_from_buffer(png.tobytes()),
+            constants.MIME_TYPE_PNG)
+        self.assertEqual(
+            utils.get_mime_type_from_buffer(jpeg.tobytes()),
+            constants.MIME_TYPE_JPEG)
+        self.assertEqual(
+            utils.get_mime_type_from_buffer(b"just some text"), "text/plain")
+
+    def test_get_base64_image_from_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        cv2.imwrite(path + ".png", self.image)
+        os.rename(path + ".png", path)
+
+        img_src = utils.get_base64_image_from_file(path)
+        decoded = self.decode(img_src, constants.IMAGE_PNG_BASE64_SIG)
+        self.assertTrue(np.array_equal(decoded, self.image))
+        os.remove(path)
+
+        self.assertRaises(InvalidFilePathException,
+                          utils.get_base64_image_from_file, path)
+
+    def test_decode_image_object(self):
+        content = cv2.imencode(".png", self.image)[1].tobytes()
+        spooled = tempfile.TemporaryFile()
+        spooled.write(content)
+
+        for stream in (io.BytesIO(content), spooled):
+            stream.seek(4)
+            buf = utils.get_image_buffer(stream)
+            self.assertEqual(buf.tobytes(), content)
+            self.assertEqual(stream.tell(), 0)
+
+            decoded = utils.decode_image_object(stream)
+            self.assertTrue(np.array_equal(decoded, self.image))
+            # The buffer does not keep the stream from being closed.
+            stream.close()
+            self.assertEqual(buf.tobytes(), content)
+
+    def test_decode_image_buffer_options(self):
+        image = np.zeros((120, 160, 3), dtype=np.uint8)
+        for extension in (".jpg", ".png"):
+            buf = cv2.imencode(extension, image)[1]
+            self.assertEqual(
+                utils.get_image_dimensions_from_buffer(buf), (160, 120))
+
+            reduced = utils.decode_image_buffer(buf, max_dimension=40)
+            self.assertEqual(reduced.shape, (30, 40, 3))
+            reduced = utils.decode_image_buffer(
+                buf, max_dimension=50, grayscale=True)
+            self.assertEqual(reduced.shape, (60, 80))
+
+        self.assertIsNone(utils.get_image_dimensions_from_buffer(b"GIF89a"))
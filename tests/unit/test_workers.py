@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+
+from origami_lib import constants
+from origami_lib.exceptions import (InjectQueueFullException,
+                                    MismatchTypeException)
+from origami_lib.workers import FunctionExecutor, ImageCodecPool, InjectQueue
+
+
+class InjectQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def blocking_send(self, payload):
+        self.started.set()
+        self.release.wait(5)
+        return payload["data"]
+
+    def test_submit(self):
+        queue = InjectQueue(lambda payload: payload["data"], maxsize=2)
+        futures = [queue.submit({"data": i}) for i in range(5)]
+
+        self.assertEqual([f.result(5) for f in futures], list(range(5)))
+        stats = queue.get_stats()
+        self.assertEqual(stats["sent"], 5)
+        self.assertEqual(stats["depth"], 0)
+        queue.close()
+
+    def test_raise_policy(self):
+        queue = InjectQueue(
+            self.blocking_send,
+            maxsize=1,
+            workers=1,
+            policy=constants.INJECT_QUEUE_POLICY_RAISE)
+        first = queue.submit({"data": 0})
+        self.started.wait(5)
+        queue.submit({"data": 1})
+
+        self.assertRaises(InjectQueueFullException, queue.submit, {"data": 2})
+        self.release.set()
+        self.assertEqual(first.result(5), 0)
+        queue.close()
+
+    def test_drop_oldest_policy(self):
+        queue = InjectQueue(
+            self.blocking_send,
+            maxsize=1,
+            workers=1,
+            policy=constants.INJECT_QUEUE_POLICY_DROP_OLDEST)
+        queue.submit({"data": 0})
+        self.started.wait(5)
+        dropped = queue.submit({"data": 1})
+        kept = queue.submit({"data": 2})
+
+        self.assertRaises(InjectQueueFullException, dropped.result, 5)
+        self.release.set()
+        self.assertEqual(kept.result(5), 2)
+        self.assertEqual(queue.get_stats()["dropped"], 1)
+        queue.close()
+
+
+class ImageCodecPoolTest(unittest.TestCase):
+    def test_map(self):
+        def slow_square(x):
+            time.sleep(0.01 * (5 - x))
+            return x * x
+
+        pool = ImageCodecPool(max_workers=4)
+        self.assertEqual(pool.map(slow_square, range(5)), [0, 1, 4, 9, 16])
+
+        stats = pool.get_stats()
+        self.assertEqual(stats["images"], 5)
+        self.assertEqual(len(stats["last_batch_times"]), 5)
+        self.assertGreater(stats["last_batch_times"][0],
+                           stats["last_batch_times"][4])
+        pool.shutdown()
+
+
+class FunctionExecutorTest(unittest.TestCase):
+    def test_submit(self):
+        executor = FunctionExecutor(max_workers=2)
+        self.assertEqual(executor.submit(pow, 2, 3).result(5), 8)
+        failed = executor.submit(pow, "2", 3)
+        self.assertRaises(TypeError, failed.result, 5)
+        # Waits for the done callbacks run by the workers.
+        executor.shutdown()
+
+        stats = executor.get_stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["running"], 0)
+
+    def test_process_executor(self):
+        executor = FunctionExecutor(
+            kind=constants.FUNCTION_EXECUTOR_PROCESS, max_workers=1)
+        self.assertEqual(executor.submit(pow, 2, 10).result(30), 1024)
+        executor.shutdown()
+
+        self.assertRaises(MismatchTypeException, executor.configure,
+                          "not-a-kind")